@@ -0,0 +1,374 @@
+"""
+Benchmark: the local filtering hot path on synthetic Google Lens payloads
+
+Generates realistic visual_matches (marketplaces, brand sites, other shops and
+unknown domains; every price format extract_price_from_match handles; titles
+with categories and colours) and reports
+- per function: ns/call, peak bytes allocated per call, bytes kept per call
+- per catalog size (100 .. 100k products): µs/product, products/s,
+  peak and retained memory of extract_product_info over the whole catalog
+Results are compared against a stored baseline (regressions are flagged and
+the exit code is 1); --save-baseline records the current run as the baseline.
+Baselines are machine-specific - record one per machine before comparing.
+
+Usage: python benchmarks/bench_filters.py [--sizes 100 1000 10000 100000] [--sample 2000]
+                                          [--baseline PATH] [--save-baseline] [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import local
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "filters_baseline.json")
+
+BRANDS = ["BEEGLEE", "SASSAFRAS", "The Indian Garage Co", "Campus Sutra", "Bewakoof",
+          "Qissa", "Bear House", "Haute Sauce", "Chapter 2", "Unlisted Label"]
+CATEGORIES = {
+    "Shirts": ["Shirt", "Linen Shirt", "Overshirt"],
+    "T-Shirts": ["T-Shirt", "Tee", "Graphic Tee"],
+    "Jeans": ["Jeans", "Wide Leg Jeans"],
+    "Trousers": ["Trousers", "Cargo Pants"],
+    "Kurtas": ["Kurta", "Kurti"],
+    "Dresses": ["Dress", "Midi Dress"],
+    "Tops": ["Top", "Corset Top", "Crop Top", "Bodysuit", "Cami"],
+    "Jackets": ["Jacket", "Blazer"],
+    "Sweatshirts": ["Sweatshirt", "Hoodie"],
+    "Skirts": ["Skirt", "Mini Skirt"],
+    "Caps": ["Cap"],
+}
+ADJECTIVES = ["Oversized", "Slim Fit", "Printed", "Striped", "Linen", "Denim", "Cotton",
+              "Relaxed", "Cropped", "Ribbed", "Textured", "Solid", "Washed", "Floral"]
+COLORS = ["Black", "White", "Blue", "Navy", "Olive", "Beige", "Maroon", "Pink", "Grey", "Mustard", ""]
+GENDERS = ["Men", "Women", "Unisex"]
+OTHER_SHOPS = ["ajio.com", "amazon.in", "flipkart.com", "nykaafashion.com", "tatacliq.com"]
+TRACKING_SUFFIXES = ["", "", "", "?utm_source=lens&utm_medium=organic", "?srsltid=AfmBOo", "#reviews"]
+
+
+def slug(text):
+    return "-".join(text.lower().split())
+
+
+def site_domains():
+    """site_key -> domains from the live registry file"""
+    with open(local.REGISTRY_PATH, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {key: site["domains"] for key, site in data["sites"].items() if site.get("domains")}
+
+
+def make_product(rng, i):
+    category = rng.choice(list(CATEGORIES))
+    title = " ".join(w for w in (rng.choice(COLORS), rng.choice(ADJECTIVES), rng.choice(CATEGORIES[category])) if w)
+    return {
+        "style_id": f"STL_BENCH{i:08d}",
+        "brand": rng.choice(BRANDS),
+        "product_title": title,
+        "gender": rng.choice(GENDERS),
+        "category": category,
+        "min_price_rupees": f"{rng.randrange(299, 4999)}.0",
+        "image": f"https://storage.klydo.in/product/bench{i}.jpg",
+    }
+
+
+def make_price(rng, base):
+    """A price in one of the shapes SerpAPI returns (or none at all)"""
+    value = round(base * rng.uniform(0.5, 1.6))
+    kind = rng.randrange(8)
+    if kind == 0:
+        return {"value": f"₹{value:,}*", "extracted_value": value}
+    if kind == 1:
+        return {"extracted_value": float(value)}
+    if kind == 2:
+        return f"₹{value:,}"
+    if kind == 3:
+        return f"Rs. {value}"
+    if kind == 4:
+        return f"INR {value:,}.00"
+    if kind == 5:
+        return {"value": "N/A"}
+    return None
+
+
+def make_visual_matches(rng, product, domains, n=None):
+    """Lens-like visual_matches for one product - roughly half are near-duplicates of it"""
+    n = n or rng.randrange(20, 61)
+    brand_site = local.get_registry().brand_site(product["brand"])
+    base_price = float(product["min_price_rupees"])
+    site_keys = list(domains)
+    matches = []
+    for rank in range(n):
+        roll = rng.random()
+        if roll < 0.3:
+            site_key = rng.choice(["myntra", "slikk"])
+        elif roll < 0.45 and brand_site in domains:
+            site_key = brand_site
+        elif roll < 0.6:
+            site_key = rng.choice(site_keys)
+        else:
+            site_key = None
+        host = rng.choice(domains[site_key]) if site_key else rng.choice(OTHER_SHOPS)
+
+        if rng.random() < 0.5:
+            title = f"{product['brand']} {product['product_title']}"
+            if rng.random() < 0.2:
+                title = title.replace(title.split()[1], rng.choice(COLORS) or "Classic", 1)
+        else:
+            other = make_product(rng, rank)
+            title = f"{other['brand']} {other['product_title']}"
+
+        item_id = rng.randrange(10 ** 6, 10 ** 8)
+        path = rng.choice([
+            f"/{slug(product['category'])}/{slug(product['brand'])}/{slug(title)}/{item_id}/buy",
+            f"/products/{slug(title)}-{item_id}",
+            f"/p/{item_id}",
+            f"/collections/{slug(product['category'])}",
+            f"/search?q={slug(title)}",
+        ])
+        match = {
+            "title": title,
+            "link": f"https://{rng.choice(['www.', ''])}{host}{path}{rng.choice(TRACKING_SUFFIXES)}",
+            "source": site_key.replace("_", " ").title() if site_key else host,
+        }
+        price = make_price(rng, base_price)
+        if price is not None:
+            match["price"] = price
+        matches.append(match)
+    return matches
+
+
+def make_catalog(n_products, domains, seed=11):
+    rng = random.Random(seed)
+    for i in range(n_products):
+        product = make_product(rng, i)
+        yield product, make_visual_matches(rng, product, domains)
+
+
+class NullWriter:
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def clear_caches():
+    """Cold per-URL / per-title caches, as for a fresh catalog (brand caches stay warm)"""
+    local.canonicalize_url.cache_clear()
+    local.title_keywords.cache_clear()
+    local.title_colors.cache_clear()
+    local.get_registry().identify_host.cache_clear()
+
+
+def function_calls(catalog):
+    """(name, [(func, args), ...]) for every hot-path function over the sample catalog"""
+    registry = local.get_registry()
+    calls = {name: [] for name in ("identify_site", "is_valid_product_url", "check_brand_relaxed_match",
+                                   "calculate_title_similarity", "extract_price_from_match", "extract_product_info")}
+    for product, matches in catalog:
+        brand_site = registry.brand_site(product["brand"])
+        allowed_sites = registry.primary_sites + ([brand_site] if brand_site else [])
+        calls["extract_product_info"].append(
+            (local.extract_product_info, (matches, product["brand"], allowed_sites, product)))
+        for match in matches:
+            link = match["link"]
+            site_key = local.identify_site(link)
+            calls["identify_site"].append((local.identify_site, (link,)))
+            calls["extract_price_from_match"].append((local.extract_price_from_match, (match,)))
+            calls["calculate_title_similarity"].append(
+                (local.calculate_title_similarity, (product["product_title"], match["title"].lower())))
+            if site_key:
+                calls["is_valid_product_url"].append((local.is_valid_product_url, (local.canonicalize_url(link),)))
+                calls["check_brand_relaxed_match"].append(
+                    (local.check_brand_relaxed_match, (match, product["brand"], site_key)))
+    return calls
+
+
+def bench_function(calls, repeat):
+    """Best-of-repeat ns/call (cold caches) and tracemalloc bytes per call"""
+    best = float("inf")
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        for func, args in calls:
+            func(*args)
+        best = min(best, time.perf_counter() - start)
+
+    clear_caches()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    peak_total = 0
+    for func, args in calls:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func(*args)
+        peak_total += tracemalloc.get_traced_memory()[1] - current
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n = len(calls)
+    return {
+        "calls": n,
+        "ns_per_call": round(best / n * 1e9, 1),
+        "peak_bytes_per_call": round(peak_total / n, 1),
+        "kept_bytes_per_call": round((after - before) / n, 1),
+    }
+
+
+def bench_catalog(n_products, domains, chunk=1000):
+    """extract_product_info over a whole catalog (generated in chunks, generation not timed)"""
+    registry = local.get_registry()
+
+    def run(trace):
+        clear_caches()
+        elapsed = 0.0
+        peak = 0
+        catalog = make_catalog(n_products, domains)
+        baseline = tracemalloc.get_traced_memory()[0] if trace else 0
+        blocks = sys.getallocatedblocks()
+        done = 0
+        while done < n_products:
+            batch = [next(catalog) for _ in range(min(chunk, n_products - done))]
+            jobs = []
+            for product, matches in batch:
+                brand_site = registry.brand_site(product["brand"])
+                jobs.append((matches, product["brand"], registry.primary_sites + ([brand_site] if brand_site else []), product))
+            if trace:
+                current = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            start = time.perf_counter()
+            for args in jobs:
+                local.extract_product_info(*args)
+            elapsed += time.perf_counter() - start
+            if trace:
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+            done += len(batch)
+            del batch, jobs
+        retained = tracemalloc.get_traced_memory()[0] - baseline if trace else 0
+        return elapsed, peak, retained, sys.getallocatedblocks() - blocks
+
+    elapsed, _, _, _ = run(trace=False)
+    tracemalloc.start()
+    try:
+        _, peak, retained, blocks = run(trace=True)
+    finally:
+        tracemalloc.stop()
+    return {
+        "us_per_product": round(elapsed / n_products * 1e6, 2),
+        "products_per_second": round(n_products / elapsed, 1),
+        "peak_kib": round(peak / 1024, 1),
+        "retained_kib": round(retained / 1024, 1),
+        "retained_blocks": blocks,
+    }
+
+
+# Metrics compared against the baseline - (higher is worse, absolute noise floor)
+COMPARED = {
+    "ns_per_call": 50,
+    "peak_bytes_per_call": 64,
+    "kept_bytes_per_call": 64,
+    "us_per_product": 5,
+    "peak_kib": 64,
+    "retained_kib": 64,
+}
+
+
+def compare(section, name, result, baseline, tolerance):
+    """Regression notes for one result row against its baseline row"""
+    old_row = baseline.get(section, {}).get(name)
+    if not old_row:
+        return []
+    notes = []
+    for metric, floor in COMPARED.items():
+        if metric not in result or metric not in old_row:
+            continue
+        new, old = result[metric], old_row[metric]
+        if new > old * (1 + tolerance) and new - old > floor:
+            notes.append(f"{name} {metric}: {old:g} → {new:g} (+{(new / old - 1) if old else 1:.0%})")
+    return notes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--sample", type=int, default=2000, help="products in the per-function sample")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown/growth (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    watcher = local.registry_watcher
+    original_interval = watcher.check_interval
+    watcher.check_interval = float("inf")  # no reloads while timing
+    domains = site_domains()
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "functions": {},
+        "catalog": {},
+    }
+    regressions = []
+
+    try:
+        with redirect_stdout(NullWriter()):
+            sample = list(make_catalog(args.sample, domains, seed=3))
+            calls = function_calls(sample)
+        print(f"{'function':<28} | {'calls':>7} | {'ns/call':>9} | {'peak B/call':>11} | {'kept B/call':>11}")
+        print("-" * 78)
+        for name, func_calls in calls.items():
+            with redirect_stdout(NullWriter()):
+                result = bench_function(func_calls, args.repeat)
+            report["functions"][name] = result
+            notes = compare("functions", name, result, baseline, args.tolerance)
+            regressions += notes
+            print(f"{name:<28} | {result['calls']:>7} | {result['ns_per_call']:>9.0f} | "
+                  f"{result['peak_bytes_per_call']:>11.0f} | {result['kept_bytes_per_call']:>11.0f}"
+                  f"{'  ⚠️' if notes else ''}")
+
+        print()
+        print(f"{'products':>9} | {'µs/product':>10} | {'products/s':>10} | {'peak KiB':>9} | "
+              f"{'kept KiB':>9} | {'kept blocks':>11}")
+        print("-" * 74)
+        for n_products in args.sizes:
+            with redirect_stdout(NullWriter()):
+                result = bench_catalog(n_products, domains)
+            report["catalog"][str(n_products)] = result
+            notes = compare("catalog", str(n_products), result, baseline, args.tolerance)
+            regressions += notes
+            print(f"{n_products:>9} | {result['us_per_product']:>10.1f} | {result['products_per_second']:>10.0f} | "
+                  f"{result['peak_kib']:>9.0f} | {result['retained_kib']:>9.0f} | {result['retained_blocks']:>11}"
+                  f"{'  ⚠️' if notes else ''}")
+    finally:
+        watcher.check_interval = original_interval
+
+    print()
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Baseline saved: {args.baseline}")
+    elif not baseline:
+        print(f"ℹ️ No baseline at {args.baseline} - run with --save-baseline to record one")
+    elif regressions:
+        print(f"⚠️ {len(regressions)} REGRESSION(S) vs baseline (tolerance {args.tolerance:.0%}):")
+        for note in regressions:
+            print(f"   • {note}")
+        sys.exit(1)
+    else:
+        print(f"✅ No regressions vs baseline (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
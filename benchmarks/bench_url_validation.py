@@ -0,0 +1,80 @@
+"""
+Benchmark: per-URL cost of is_valid_product_url as the site table grows
+
+Registers N synthetic brand sites in the site registry and times validation
+of a fixed URL mix (real sites, synthetic sites, unknown domains, category pages).
+With dict dispatch the cost per URL should stay flat as N grows.
+
+Usage: python benchmarks/bench_url_validation.py [--urls 20000] [--sites 0 100 1000 10000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import local
+from site_registry import SiteRegistry
+
+
+def synthetic_registry(n_sites):
+    with open(local.REGISTRY_PATH, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for i in range(n_sites):
+        data["sites"][f"brand{i}"] = {"domains": [f"brand{i}.in"], "product_path": "shopify"}
+    return SiteRegistry(data)
+
+
+def sample_urls(n_urls, n_sites, seed=7):
+    rng = random.Random(seed)
+    real_domains = list(local.get_registry().product_rules)
+    paths = ["/products/linen-shirt-123", "/p/98765", "/shirts/brand/123/buy",
+             "/collections/shirts", "/search?q=shirt", "/a/b/c", "/product/tee?variant=1"]
+    urls = []
+    for _ in range(n_urls):
+        kind = rng.random()
+        if kind < 0.5:
+            host = rng.choice(real_domains)
+        elif kind < 0.8 and n_sites:
+            host = f"brand{rng.randrange(n_sites)}.in"
+        else:
+            host = f"unknown{rng.randrange(1000)}.com"
+        urls.append(f"https://www.{host}{rng.choice(paths)}")
+    return urls
+
+
+def time_per_url(urls, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for url in urls:
+            local.is_valid_product_url(url)
+        best = min(best, time.perf_counter() - start)
+    return best / len(urls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--urls", type=int, default=20000)
+    parser.add_argument("--sites", type=int, nargs="+", default=[0, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    watcher = local.registry_watcher
+    original, original_interval = watcher.registry, watcher.check_interval
+    watcher.check_interval = float("inf")  # no reloads while timing
+    print(f"{'extra sites':>12} | {'rules':>7} | {'ns/url':>8}")
+    print("-" * 34)
+    try:
+        for n_sites in args.sites:
+            watcher.registry = synthetic_registry(n_sites)
+            per_url = time_per_url(sample_urls(args.urls, n_sites))
+            print(f"{n_sites:>12} | {len(watcher.registry.product_rules):>7} | {per_url * 1e9:>8.0f}")
+    finally:
+        watcher.registry, watcher.check_interval = original, original_interval
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional - only needed for --columnar output
+    pa = None
+
+# Typed output schema: prices are numbers, missing URLs/prices are nulls
+COLUMNS = [
+    ("style_id", "string"), ("brand", "string"), ("product_title", "string"),
+    ("gender", "string"), ("category", "string"), ("status", "string"), ("brand_site", "string"),
+    ("klydo_price", "float64"), ("myntra_price", "float64"), ("slikk_price", "float64"), ("brand_price", "float64"),
+    ("klydo_url", "string"), ("myntra_url", "string"), ("slikk_url", "string"), ("brand_url", "string"),
+    ("input_position", "int64"),
+]
+
+
+def to_float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+class ColumnarWriter:
+    """
+    Streaming Parquet (.parquet) or Arrow IPC (.arrow / .feather) writer
+    Rows are buffered column-wise and flushed every batch_size rows, so memory
+    stays at one batch however large the output is. Needs pyarrow.
+    """
+    def __init__(self, path, batch_size=50000):
+        if pa is None:
+            raise RuntimeError("columnar output needs pyarrow (pip install pyarrow)")
+        self.path = path
+        self.batch_size = batch_size
+        self.rows = 0
+        self.schema = pa.schema([(name, getattr(pa, type_name)()) for name, type_name in COLUMNS])
+        if path.endswith((".arrow", ".feather")):
+            self._writer = pa.ipc.new_file(path, self.schema)
+        else:
+            self._writer = pa.parquet.ParquetWriter(path, self.schema, compression="zstd")
+        self._columns = {name: [] for name, _ in COLUMNS}
+
+    def write(self, row):
+        """row: {column: value} with None for nulls (see COLUMNS)"""
+        for name, values in self._columns.items():
+            values.append(row.get(name))
+        self.rows += 1
+        if len(self._columns["style_id"]) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._columns["style_id"]:
+            return
+        batch = pa.record_batch(
+            [pa.array(self._columns[name], type=self.schema.field(name).type) for name, _ in COLUMNS],
+            schema=self.schema,
+        )
+        self._writer.write_batch(batch)
+        self._columns = {name: [] for name, _ in COLUMNS}
+
+    def close(self):
+        self._flush()
+        self._writer.close()
@@ -0,0 +1,108 @@
+import bisect
+import threading
+
+
+class CreditBudget:
+    """
+    SerpAPI credit accounting for one run, with an optional cap (limit=None = no cap)
+    - spend(): every real API call costs one credit (cache hits and coalesced
+      lookups are free, failed calls are not billed)
+    - reserve() holds a credit before a call, so concurrent workers never go
+      over the cap; release() drops the hold once the call is done
+    - pass2_worth_it(): Pass 2 credits go where the expected number of rescued
+      sites is highest, without starving the Pass 1 searches still to come
+    """
+    def __init__(self, limit=None, min_pass2_gain=0.05):
+        self.limit = limit
+        self.min_pass2_gain = min_pass2_gain
+        self.products_total = 0
+        self.products_started = 0
+        self.budget_skipped = 0
+        self.spent = {"1": 0, "2": 0}
+        self.found = {"1": 0, "2": 0}
+        self.held = 0
+        self._pass2_gains = []   # sorted expected gains of every Pass 2 candidate so far
+        self._pass1_done = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_spent(self):
+        return self.spent["1"] + self.spent["2"]
+
+    def remaining(self):
+        """Credits not yet spent or held (None without a cap)"""
+        if self.limit is None:
+            return None
+        return self.limit - self.total_spent - self.held
+
+    def reserve(self):
+        """Hold one credit for an upcoming call; False when the budget is used up"""
+        with self._lock:
+            if self.limit is not None and self.total_spent + self.held + 1 > self.limit:
+                return False
+            self.held += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.held -= 1
+
+    def spend(self, pass_label):
+        with self._lock:
+            self.spent[pass_label] += 1
+
+    def start_product(self):
+        """Reserve the Pass 1 credit of the next product; False (product skipped) when out of budget"""
+        with self._lock:
+            self.products_started += 1
+        if self.reserve():
+            return True
+        with self._lock:
+            self.budget_skipped += 1
+        return False
+
+    def record_found(self, pass_label, sites_found):
+        with self._lock:
+            self.found[pass_label] += sites_found
+            if pass_label == "1":
+                self._pass1_done += 1
+
+    def pass2_worth_it(self, expected_gain):
+        """
+        Should a product spend a credit on Pass 2 for an expected gain (sites)?
+        - spare credits (beyond one Pass 1 per product still to come) fund the
+          best expected gains seen so far, in proportion to how far they reach
+        - with no spare credits, Pass 2 takes a credit from a later product's
+          Pass 1, so it must beat the sites Pass 1 finds per credit
+        """
+        with self._lock:
+            bisect.insort(self._pass2_gains, expected_gain)
+            if self.limit is None:
+                return True
+            if expected_gain < self.min_pass2_gain:
+                return False
+            products_left = self.products_total - self.products_started
+            spare = self.limit - self.total_spent - self.held - products_left
+            if spare <= 0:
+                pass1_yield = self.found["1"] / self.spent["1"] if self.spent["1"] else 1.0
+                return expected_gain > pass1_yield
+            # Expected Pass 2 demand from the rest of the catalog, at the rate seen so far
+            demand = products_left * len(self._pass2_gains) / max(self._pass1_done, 1)
+            if spare >= demand:
+                return True
+            cutoff = self._pass2_gains[int(len(self._pass2_gains) * (1 - spare / demand))]
+            return expected_gain >= cutoff
+
+    def print_report(self):
+        cap = f" of {self.limit}" if self.limit is not None else ""
+        print(f"💳 CREDITS: {self.total_spent}{cap} spent (Pass 1 {self.spent['1']}, Pass 2 {self.spent['2']})")
+        if self.budget_skipped:
+            print(f"   ⛔ Budget reached: {self.budget_skipped} product(s) not searched")
+        yields = []
+        for label in ("1", "2"):
+            if self.spent[label]:
+                yields.append(f"Pass {label} {self.found[label] / self.spent[label]:.2f}")
+        if self.total_spent:
+            found = self.found["1"] + self.found["2"]
+            yields.append(f"overall {found / self.total_spent:.2f}")
+            print(f"   Sites found per credit: {', '.join(yields)}")
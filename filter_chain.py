@@ -0,0 +1,87 @@
+import threading
+import time
+
+
+class MatchFilter:
+    """One named filter of a FilterChain with its run-wide cost / rejection statistics"""
+    def __init__(self, name, check):
+        self.name = name
+        self.check = check
+        self.calls = 0
+        self.rejections = 0
+        self.seconds = 0.0
+
+    def cost_per_rejection(self):
+        """Expected time spent per match this filter removes (lower = run earlier)"""
+        cost = self.seconds / self.calls if self.calls else 0.0
+        rejection_rate = (self.rejections + 1) / (self.calls + 2)
+        return cost / rejection_rate
+
+
+class FilterChain:
+    """
+    Pluggable, self-ordering chain of match filters
+    - run(*args) applies the filters in order until one rejects and returns
+      its name (None = the match passed every filter)
+    - with adaptive=True the chain re-sorts itself every reorder_every runs by
+      cost / rejection rate, so cheap and selective filters run first
+    - a rejected match is reported against the first filter in report_order
+      (default: the order given) that rejects it, whatever order the filters
+      ran in - filters after the failing one in run order but before it in
+      report order are checked for that
+    The filters are independent predicates, so the order changes only the cost.
+    Statistics are updated without a lock - they only steer the ordering.
+    """
+    def __init__(self, filters, adaptive=True, reorder_every=500, report_order=None):
+        self.filters = [MatchFilter(name, check) for name, check in filters]
+        self.order = list(self.filters)
+        by_name = {f.name: f for f in self.filters}
+        self.report_order = [by_name[name] for name in report_order] if report_order else list(self.filters)
+        self.adaptive = adaptive
+        self.reorder_every = reorder_every
+        self.reorders = 0
+        self._runs = 0
+        self._lock = threading.Lock()
+
+    def run(self, *args):
+        self._runs += 1
+        if self.adaptive and self._runs % self.reorder_every == 0:
+            self.reorder()
+        passed = []
+        for match_filter in self.order:
+            if self._check(match_filter, args):
+                passed.append(match_filter)
+                continue
+            for earlier in self.report_order:
+                if earlier is match_filter:
+                    break
+                if earlier not in passed and not self._check(earlier, args):
+                    return earlier.name
+            return match_filter.name
+        return None
+
+    def _check(self, match_filter, args):
+        started = time.perf_counter()
+        kept = match_filter.check(*args)
+        match_filter.seconds += time.perf_counter() - started
+        match_filter.calls += 1
+        if not kept:
+            match_filter.rejections += 1
+        return kept
+
+    def reorder(self):
+        with self._lock:
+            order = sorted(self.filters, key=MatchFilter.cost_per_rejection)
+            if [f.name for f in order] != [f.name for f in self.order]:
+                self.reorders += 1
+            self.order = order
+
+    def describe(self):
+        return " → ".join(f.name for f in self.order)
+
+    def print_report(self):
+        print(f"🧪 FILTER CHAIN: {self.describe()} (re-ordered {self.reorders} time(s))")
+        for f in self.order:
+            if f.calls:
+                print(f"   {f.name:<11} {f.calls:>8} checked, {f.rejections / f.calls:>4.0%} rejected, "
+                      f"{f.seconds / f.calls * 1e6:>6.1f}µs/check")
@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import deque
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on concurrent SerpAPI requests
+    - additive increase: each healthy response adds 1/limit, so the limit grows
+      by about one per round of `limit` requests
+    - multiplicative decrease: a 429, a 5xx/timeout, or a p95 latency (over the
+      last `window` responses) above latency_tolerance x the best p95 seen
+      multiplies the limit by backoff - at most once per round, so one burst
+      of errors counts once
+    acquire() blocks while `limit` requests are in flight; release() reports the outcome.
+    """
+    def __init__(self, initial=4, min_limit=1, max_limit=16, backoff=0.5, latency_tolerance=2.0,
+                 window=20, listener=None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.listener = listener
+        self.in_flight = 0
+        self.peak = int(self.limit)
+        self.decreases = {"throttled": 0, "error": 0, "latency": 0}
+        self._latencies = deque(maxlen=window)
+        self._best_p95 = None
+        self._since_decrease = 0
+        self._cond = threading.Condition()
+
+    def set_max(self, max_limit):
+        with self._cond:
+            self.max_limit = max(self.min_limit, max_limit)
+            self.limit = min(self.limit, self.max_limit)
+            self.peak = min(self.peak, self.max_limit)
+            self._cond.notify_all()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, outcome, latency=None):
+        """
+        outcome: "ok", "throttled" (429) or "error" (5xx, timeout, connection error),
+        or None when the slot is given back without sending a request
+        """
+        message = None
+        with self._cond:
+            self.in_flight -= 1
+            if outcome is None:
+                self._cond.notify_all()
+                return
+            self._since_decrease += 1
+            reason = None if outcome == "ok" else outcome
+            if reason is None and latency is not None:
+                reason = self._check_latency(latency)
+            if reason is None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.peak = max(self.peak, int(self.limit))
+            elif self._since_decrease >= int(self.limit) and int(self.limit) > self.min_limit:
+                previous = int(self.limit)
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._since_decrease = 0
+                self.decreases[reason] += 1
+                if reason == "latency":
+                    self._latencies.clear()  # judge the new level on fresh samples
+                message = f"🐢 CONCURRENCY {previous} → {int(self.limit)} ({_REASONS[reason]})"
+            self._cond.notify_all()
+        if message and self.listener:
+            self.listener("backoff", message)
+
+    def _check_latency(self, latency):
+        self._latencies.append(latency)
+        if len(self._latencies) < self._latencies.maxlen:
+            return None
+        ordered = sorted(self._latencies)
+        p95 = ordered[int(0.95 * (len(ordered) - 1))]
+        if self._best_p95 is None or p95 < self._best_p95:
+            self._best_p95 = p95
+        elif p95 > self._best_p95 * self.latency_tolerance:
+            return "latency"
+        return None
+
+    def describe(self):
+        backoffs = ", ".join(f"{_REASONS[reason]}: {n}" for reason, n in self.decreases.items() if n)
+        return (f"limit {int(self.limit)} (peak {self.peak}, ceiling {self.max_limit}), "
+                f"{sum(self.decreases.values())} backoff(s){f' [{backoffs}]' if backoffs else ''}")
+
+
+_REASONS = {"throttled": "HTTP 429", "error": "5xx/timeouts", "latency": "p95 latency rising"}
+
+
+class CircuitBreaker:
+    """
+    Pauses all SerpAPI requests while most recent ones fail
+    - closed: requests flow; opens once failure_rate of the last `window`
+      requests (at least window // 2 of them) failed
+    - open: before_request() blocks every caller for pause_seconds
+    - half-open: one probe request goes through - success closes the breaker,
+      failure re-opens it with the pause doubled (up to max_pause_seconds)
+    """
+    def __init__(self, failure_rate=0.5, window=20, pause_seconds=30.0, max_pause_seconds=600.0, listener=None):
+        self.failure_rate = failure_rate
+        self.window = window
+        self.pause_seconds = pause_seconds
+        self.max_pause_seconds = max_pause_seconds
+        self.listener = listener
+        self.state = "closed"
+        self.trips = 0
+        self.paused_seconds = 0.0
+        self._outcomes = deque(maxlen=window)
+        self._pause = pause_seconds
+        self._reopen_at = 0.0
+        self._probing = False
+        self._cond = threading.Condition()
+
+    def before_request(self):
+        """Block while the breaker is open; returns the seconds spent waiting"""
+        started = time.monotonic()
+        message = None
+        with self._cond:
+            while self.state != "closed":
+                now = time.monotonic()
+                if self.state == "open" and now >= self._reopen_at:
+                    self.state = "half_open"
+                    message = "🔌 CIRCUIT HALF-OPEN: probing SerpAPI with one request"
+                if self.state == "half_open" and not self._probing:
+                    self._probing = True
+                    break
+                self._cond.wait(max(0.05, self._reopen_at - now) if self.state == "open" else 1.0)
+        if message and self.listener:
+            self.listener("half_open", message)
+        return time.monotonic() - started
+
+    def cancel(self):
+        """A request let through by before_request() was not sent - free the half-open probe"""
+        with self._cond:
+            if self.state == "half_open":
+                self._probing = False
+            self._cond.notify_all()
+
+    def record(self, success):
+        message = event = None
+        with self._cond:
+            if self.state == "half_open":
+                self._probing = False
+                if success:
+                    self.state, event = "closed", "close"
+                    self._pause = self.pause_seconds
+                    self._outcomes.clear()
+                    message = "✅ CIRCUIT CLOSED: SerpAPI is answering again - resuming"
+                else:
+                    self._pause = min(self.max_pause_seconds, self._pause * 2)
+                    event, message = "open", self._open(f"probe failed - pausing {self._pause:.0f}s")
+            elif self.state == "closed":
+                self._outcomes.append(success)
+                failures = self._outcomes.count(False)
+                if len(self._outcomes) >= max(1, self.window // 2) and \
+                        failures >= self.failure_rate * len(self._outcomes):
+                    event, message = "open", self._open(
+                        f"{failures}/{len(self._outcomes)} recent SerpAPI requests failed - pausing {self._pause:.0f}s")
+            self._cond.notify_all()
+        if message and self.listener:
+            self.listener(event, message)
+
+    def _open(self, reason):
+        self.state = "open"
+        self.trips += 1
+        self.paused_seconds += self._pause
+        self._reopen_at = time.monotonic() + self._pause
+        self._outcomes.clear()
+        return f"⛔ CIRCUIT OPEN: {reason}"
+
+    def describe(self):
+        return f"{self.state.replace('_', '-')}, tripped {self.trips} time(s), paused {self.paused_seconds:.0f}s"
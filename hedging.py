@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def percentile(values, q):
+    """q-quantile (0-1) of values by nearest rank (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Hedger:
+    """
+    Hedged requests - cut the tail latency of slow calls
+    - run(send) sends the request; if it has not answered after the tracked
+      `hedge_percentile` latency of recent requests, one duplicate is sent and
+      the first usable answer wins (the other keeps running and is discarded)
+    - duplicates are capped at max_fraction of all requests
+    - the latency without hedging of the last report_window requests is kept
+      next to the latency the caller saw, so report() can show what hedging
+      bought and what it cost (memory stays flat over long runs)
+    """
+    def __init__(self, hedge_percentile=0.95, max_fraction=0.05, window=200, min_samples=20, workers=64,
+                 report_window=10000):
+        self.hedge_percentile = hedge_percentile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.extra_credits = 0   # both copies answered - SerpAPI bills each
+        self._latencies = deque(maxlen=window)
+        # [latency seen, latency without hedging (None until the primary finishes)] per request
+        self._calls = deque(maxlen=report_window)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge")
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging (None = not enough history yet)"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            return percentile(self._latencies, self.hedge_percentile)
+
+    def _take_hedge(self):
+        with self._lock:
+            if self.hedges + 1 > self.max_fraction * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def _timed(self, send, before_send=None):
+        if before_send:
+            before_send()
+        started = time.monotonic()
+        try:
+            return send()
+        finally:
+            self._observe(time.monotonic() - started)
+
+    def _observe(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def run(self, send, usable=lambda result: True, before_hedge=None):
+        """
+        send() -> result (may raise); usable(result) tells whether a result can
+        end the race (e.g. not a 429/5xx). before_hedge runs in the hedge's
+        thread before it is sent (e.g. a rate limiter).
+        """
+        started = time.monotonic()
+        with self._lock:
+            self.requests += 1
+        call = [None, None]
+        delay = self.hedge_delay()
+        if delay is None:
+            try:
+                return self._timed(send)
+            finally:
+                call[0] = call[1] = time.monotonic() - started
+                self._record(call)
+
+        primary = self._pool.submit(self._timed, send)
+        primary.add_done_callback(lambda _: self._primary_done(call, started))
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_hedge():
+            try:
+                return primary.result()
+            finally:
+                call[0] = time.monotonic() - started
+                self._record(call)
+
+        hedge = self._pool.submit(self._timed, send, before_hedge)
+        pending = {primary, hedge}
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in (primary, hedge):
+                if future in done and future.exception() is None and usable(future.result()):
+                    winner = future
+                    break
+        winner = winner or primary  # neither copy was usable - report the primary's outcome
+        call[0] = time.monotonic() - started
+        if winner is hedge:
+            with self._lock:
+                self.hedge_wins += 1
+        self._record(call)
+        self._count_extra_credit(primary, hedge, usable)
+        return winner.result()
+
+    def _primary_done(self, call, started):
+        with self._lock:
+            call[1] = time.monotonic() - started
+
+    def _record(self, call):
+        with self._lock:
+            self._calls.append(call)
+
+    def _count_extra_credit(self, primary, hedge, usable):
+        """Once both copies have finished: a second usable answer is a second billed search"""
+        unfinished = [2]
+
+        def finished(_):
+            with self._lock:
+                unfinished[0] -= 1
+                if unfinished[0]:
+                    return
+            if all(f.exception() is None and usable(f.result()) for f in (primary, hedge)):
+                with self._lock:
+                    self.extra_credits += 1
+        primary.add_done_callback(finished)
+        hedge.add_done_callback(finished)
+
+    def report(self):
+        """
+        {"requests", "hedges", "hedge_wins", "extra_credits", "hedged": {p50, p95, p99}, "unhedged": {...}}
+        Counts cover the whole run, percentiles the last report_window requests
+        """
+        with self._lock:
+            calls = [(seen, alone) for seen, alone in self._calls if seen is not None and alone is not None]
+            summary = {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "extra_credits": self.extra_credits,
+            }
+        for name, index in (("hedged", 0), ("unhedged", 1)):
+            values = [call[index] for call in calls]
+            summary[name] = {f"p{int(q * 100)}": percentile(values, q) for q in (0.5, 0.95, 0.99)}
+        return summary
@@ -0,0 +1,127 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from urllib.request import url2pathname
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from PIL import Image
+except ImportError:  # optional - only needed for image dedupe
+    Image = None
+
+
+def dhash(data, hash_size=8):
+    """64-bit difference hash of an image: survives re-encoding, resizing and small edits"""
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("L", (hash_size * 8, hash_size * 8))  # JPEG: decode at reduced size
+        small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+        pixels = small.tobytes()  # one byte per pixel in "L" mode
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree over hashes - finds every hash within a Hamming distance"""
+    def __init__(self):
+        self.root = None   # [hash, value, {distance: child}]
+
+    def add(self, hash_value, value):
+        node = [hash_value, value, {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(hash_value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, hash_value, max_distance):
+        """[(distance, value)] of every stored hash within max_distance"""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(hash_value, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+def group_near_duplicates(hashes, max_distance):
+    """
+    hashes: [(key, hash)] in catalog order
+    Returns {key: representative key} - each key maps to the nearest earlier
+    representative within max_distance, or to itself when it starts a new group
+    """
+    tree = BKTree()
+    representative = {}
+    for order, (key, hash_value) in enumerate(hashes):
+        matches = tree.search(hash_value, max_distance)
+        if matches:
+            representative[key] = min(matches)[1][1]
+        else:
+            tree.add(hash_value, (order, key))
+            representative[key] = key
+    return representative
+
+
+class ImageFetcher:
+    """
+    Pooled concurrent image downloader + hasher
+    http(s) URLs share one keep-alive session; file:// URLs and plain paths are
+    read from disk (local stand-ins for storage.klydo.in)
+    """
+    def __init__(self, workers=16, timeout=10.0, max_bytes=10 * 1024 * 1024):
+        if Image is None:
+            raise RuntimeError("image dedupe needs Pillow (pip install pillow)")
+        self.workers = workers
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers, max_retries=1)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def fetch(self, url):
+        """Image bytes (raises when the image cannot be fetched or is too large)"""
+        scheme = urlsplit(url).scheme.lower()
+        if scheme in ("http", "https"):
+            response = self.session.get(url, timeout=self.timeout, stream=True)
+            response.raise_for_status()
+            data = response.raw.read(self.max_bytes + 1, decode_content=True)
+        else:
+            path = url2pathname(urlsplit(url).path) if scheme == "file" else url
+            with open(os.path.expanduser(path), "rb") as f:
+                data = f.read(self.max_bytes + 1)
+        if len(data) > self.max_bytes:
+            raise ValueError(f"image larger than {self.max_bytes} bytes")
+        return data
+
+    def hash_url(self, url):
+        try:
+            return dhash(self.fetch(url))
+        except Exception:  # unreachable / not an image - searched on its own
+            return None
+
+    def hash_all(self, urls):
+        """{url: hash or None} for every url, fetched concurrently"""
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image") as executor:
+            return dict(zip(urls, executor.map(self.hash_url, urls)))
@@ -0,0 +1,105 @@
+import json
+import sqlite3
+import threading
+import time
+import hashlib
+
+
+def make_cache_key(engine, image_url, query, country, hl):
+    """Stable key for one Lens lookup - (engine, image URL, query, country, hl)"""
+    raw = json.dumps([engine, image_url, query or "", country, hl], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def trim_visual_matches(visual_matches):
+    """Keep only the match fields the local filters actually read"""
+    trimmed = []
+    for match in visual_matches or []:
+        trimmed.append({
+            "title": match.get("title", ""),
+            "link": match.get("link", ""),
+            "source": match.get("source", ""),
+            "price": match.get("price", {}),
+        })
+    return trimmed
+
+
+class LensCache:
+    """
+    Persistent SerpAPI response cache (SQLite file)
+    - Entries expire after ttl_seconds
+    - At most max_entries are kept, least recently used are evicted first
+    Safe to share between threads; WAL mode lets several processes share the file
+    """
+    def __init__(self, path, ttl_seconds, max_entries):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lens_cache ("
+            " key TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS lens_cache_lru ON lens_cache(last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM lens_cache").fetchone()[0]
+
+    def get(self, key):
+        """Return the cached payload, or None if missing/expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM lens_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            payload, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM lens_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._count -= 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE lens_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(payload)
+
+    def put(self, key, payload):
+        """Store a payload, evicting least recently used entries past max_entries"""
+        now = time.time()
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            existed = self._conn.execute(
+                "SELECT 1 FROM lens_cache WHERE key = ?", (key,)
+            ).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO lens_cache (key, payload, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, data, now, now),
+            )
+            if not existed:
+                self._count += 1
+            if self.max_entries and self._count > self.max_entries:
+                self._evict(self._count - self.max_entries)
+            self._conn.commit()
+
+    def _evict(self, n):
+        self._conn.execute(
+            "DELETE FROM lens_cache WHERE key IN ("
+            " SELECT key FROM lens_cache ORDER BY last_access LIMIT ?)",
+            (n,),
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM lens_cache").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
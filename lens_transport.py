@@ -0,0 +1,144 @@
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# HTTP statuses worth retrying - throttling and transient server errors
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LensTransportError(Exception):
+    """A SerpAPI call that failed for good (as opposed to an empty result)"""
+    def __init__(self, message, status=None, attempts=0):
+        super().__init__(message)
+        self.status = status
+        self.attempts = attempts
+
+
+class LensTransport:
+    """
+    Shared HTTP transport for all SerpAPI calls
+    - One pooled keep-alive session (no TCP+TLS handshake per call)
+    - gzip/deflate accept-encoding
+    - Bounded retries with exponential backoff + full jitter on retryable statuses/timeouts
+    - Per-call time budget across all attempts instead of a flat 60s timeout
+    - Optional concurrency limit (acquire/release(outcome, latency)) and circuit
+      breaker (before_request/record(success)) around every attempt; time spent
+      waiting on an open breaker does not count against the call budget, time
+      spent waiting for a concurrency / rate limit slot does
+    - Optional hedger (run(send, usable, before_hedge)) that duplicates slow attempts
+    """
+    def __init__(self, base_url, pool_size=10, max_retries=3, backoff_base=1.0, backoff_max=20.0,
+                 connect_timeout=5.0, read_timeout=25.0, call_budget=45.0, rate_limiter=None,
+                 concurrency=None, breaker=None, hedger=None):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.call_budget = call_budget
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.breaker = breaker
+        self.hedger = hedger
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        })
+
+    def _backoff(self, attempt, retry_after=None):
+        """Sleep time before the next attempt (honours Retry-After when given)"""
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    def get_json(self, params):
+        """
+        GET base_url with params and return the decoded JSON body
+        Raises LensTransportError once retries or the call budget run out
+        """
+        deadline = time.monotonic() + self.call_budget
+        last_error = "no attempt made"
+        last_status = None
+
+        for attempt in range(self.max_retries + 1):
+            if deadline - time.monotonic() <= 0:
+                break
+            if self.breaker:
+                deadline += self.breaker.before_request()
+            if self.concurrency:
+                self.concurrency.acquire()
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+
+            # Waiting for a request slot counts against the budget
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if self.concurrency:
+                    self.concurrency.release(None)
+                if self.breaker:
+                    self.breaker.cancel()
+                if not attempt:
+                    last_error = "call budget spent waiting for a request slot"
+                break
+
+            retry_after = None
+            outcome = "error"
+            started = time.monotonic()
+            try:
+                timeout = (self.connect_timeout, min(self.read_timeout, remaining))
+                send = lambda: self.session.get(self.base_url, params=params, timeout=timeout)
+                if self.hedger:
+                    response = self.hedger.run(
+                        send,
+                        usable=lambda r: r.status_code not in RETRYABLE_STATUSES,
+                        before_hedge=self.rate_limiter.acquire if self.rate_limiter else None,
+                    )
+                else:
+                    response = send()
+                if response.status_code in RETRYABLE_STATUSES:
+                    outcome = "throttled" if response.status_code == 429 else "error"
+                    last_status = response.status_code
+                    last_error = f"HTTP {response.status_code}"
+                    retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                else:
+                    outcome = "ok"  # answered - a 4xx here is about the request, not the load
+                    response.raise_for_status()
+                    return response.json()
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                last_status = None
+                last_error = f"{type(e).__name__}: {e}"
+            except requests.exceptions.RequestException as e:
+                # Non-retryable (4xx, invalid JSON, ...) - give up straight away
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                raise LensTransportError(str(e), status=status, attempts=attempt + 1)
+            except ValueError as e:
+                raise LensTransportError(f"Invalid JSON response: {e}", attempts=attempt + 1)
+            finally:
+                if self.concurrency:
+                    self.concurrency.release(outcome, time.monotonic() - started if outcome == "ok" else None)
+                if self.breaker:
+                    self.breaker.record(outcome == "ok")
+
+            if attempt < self.max_retries:
+                wait = self._backoff(attempt, retry_after)
+                if time.monotonic() + wait >= deadline:
+                    break
+                time.sleep(wait)
+
+        raise LensTransportError(last_error, status=last_status, attempts=attempt + 1)
+
+
+def _parse_retry_after(value):
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
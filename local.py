@@ -1,10 +1,35 @@
-import requests
+import argparse
 import csv
+import socket
 import sys
 import io
+import os
 import time
 import re
-from urllib.parse import urlparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from functools import lru_cache
+from urllib.parse import urlparse, urlsplit, urlunsplit, parse_qsl, urlencode
+
+from lens_cache import LensCache, make_cache_key, trim_visual_matches
+from lens_transport import LensTransport, LensTransportError
+from run_journal import RunJournal
+from run_manifest import RunManifest
+from records import SiteResult, Candidate, NOT_FOUND, site_results_from_json, site_results_to_json
+from columnar_output import ColumnarWriter, to_float
+from image_dedupe import ImageFetcher, group_near_duplicates
+from response_archive import ResponseArchive, ArchiveReader
+from site_registry import RegistryWatcher
+from pass_scheduler import PassScheduler
+from single_flight import SingleFlight
+from pipeline import Pipeline
+from run_metrics import Metrics, PeriodicExporter
+from work_queue import WorkQueue, SharedRateLimiter
+from credit_budget import CreditBudget
+from filter_chain import FilterChain
+from flow_control import AdaptiveConcurrency, CircuitBreaker
+from hedging import Hedger
 
 # Set UTF-8 encoding for Windows console
 if sys.platform == 'win32':
@@ -16,37 +41,289 @@ API_KEY = "90fe9a9b51538cd2fb2a4ac882dec6471108bbbbe46114f41acdd018df4e74a7"
 # Coverage threshold - trigger second pass if below this
 COVERAGE_THRESHOLD = 0.50  # 50%
 
-# Primary sites - Always search these
-PRIMARY_SITES = ["myntra", "slikk"]
-
-# Target shopping sites - Primary 2 + Brand sites
-SHOPPING_SITES = {
-    # Primary marketplaces
-    "myntra": ["myntra.com"],
-    "slikk": ["slikk.club"],
-    
-    # Brand sites
-    "bewakoof": ["bewakoof.com"],
-    "sassafras": ["sassafras.in"],
-    "indian_garage_co": ["tigc.in"],
-    "bearhouse": ["thebearhouse.com", "bearhouseindia.com", "thebearhouse.in"],
-    "bearcompany": ["bearcompany.in", "thebearcompany.com"],
-    "mydesignation": ["mydesignation.com"],
-    "beeglee": ["beeglee.in"],
-    "color_capital": ["colorcapital.in"],
-    "chapter_2": ["chapter2drip.com"],
-    "qissa": ["shopqissa.com"],
-    "mywishbag": ["mywishbag.com"],
-    "campus_sutra": ["campussutra.com"],
-    "haute_sauce": ["buyhautesauce.com"],
-    "silisoul": ["silisoul.com"],
-    "guns_and_sons": ["gunsnsons.com"],
-    
-    # Sassafras sub-brands mapped to main brand site
-    "mascln_sassafras": ["sassafras.in"],
-    "shae_by_sassafras": ["sassafras.in"],
-    "pink_paprika_by_sassafras": ["sassafras.in"],
-}
+# Concurrency - staged pipeline: read → fetch (network) → filter (CPU) → write
+MAX_WORKERS = 16         # fetch workers (ceiling for the adaptive concurrency limit below)
+FILTER_WORKERS = 2       # filter workers
+MAX_IN_FLIGHT = 32       # products between reader and writer (bounds memory)
+
+# Global SerpAPI rate limit shared by all workers (requests per second)
+REQUESTS_PER_SECOND = 2.0
+
+# Adaptive concurrency (AIMD) - in-flight SerpAPI requests grow while responses are
+# healthy and are cut on 429s, 5xx/timeouts or a rising p95 latency (False = fixed at MAX_WORKERS)
+ADAPTIVE_CONCURRENCY = True
+CONCURRENCY_INITIAL = 4
+CONCURRENCY_MIN = 1
+CONCURRENCY_BACKOFF = 0.5          # limit multiplier on overload
+LATENCY_P95_TOLERANCE = 2.0        # p95 above this multiple of the best p95 seen counts as overload
+
+# Circuit breaker - pause the whole run while most SerpAPI requests fail
+BREAKER_FAILURE_RATE = 0.5         # failed share of the last BREAKER_WINDOW requests that opens it
+BREAKER_WINDOW = 20
+BREAKER_PAUSE_SECONDS = 30         # first pause; doubles while probe requests keep failing
+BREAKER_MAX_PAUSE_SECONDS = 600
+
+# Hedged requests - a Lens request still running after the HEDGE_PERCENTILE latency
+# of recent requests gets one duplicate and the first answer wins (not on a credit budget)
+HEDGE_REQUESTS = False
+HEDGE_PERCENTILE = 0.95
+HEDGE_MAX_PERCENT = 5.0            # duplicates as % of all requests - each answered duplicate costs a credit
+
+# Local SerpAPI response cache - repeated runs reuse earlier Lens lookups
+CACHE_ENABLED = True
+CACHE_PATH = "lens_cache.sqlite"
+CACHE_TTL_SECONDS = 24 * 3600  # 1 day
+CACHE_MAX_ENTRIES = 100000     # LRU eviction beyond this
+FORCE_FRESH = False            # True = ignore cached entries (results are still re-cached)
+
+# HTTP transport - pooled keep-alive session with bounded retries
+SERPAPI_URL = "https://serpapi.com/search"
+HTTP_POOL_SIZE = 16
+HTTP_MAX_RETRIES = 3
+HTTP_CONNECT_TIMEOUT = 5     # seconds
+HTTP_READ_TIMEOUT = 25       # seconds per attempt
+HTTP_CALL_BUDGET = 45        # seconds per call, across all retries
+
+# Adaptive pass scheduling - send Pass 2 alongside Pass 1 when Pass 1 usually
+# misses for a brand, skip Pass 2 where it keeps failing to rescue a site
+ADAPTIVE_PASSES = True
+SPECULATE_MISS_PROBABILITY = 0.6  # predicted Pass 1 miss rate that triggers speculation
+SKIP_PASS2_RESCUE_RATE = 0.1      # Pass 2 success rate below which it is skipped
+SCHEDULER_MIN_SAMPLES = 5         # products per brand/site before the scheduler acts
+
+# Request coalescing - identical Lens lookups share one call (and its result for
+# the last N distinct lookups of the run)
+SINGLE_FLIGHT_MEMO_SIZE = 512
+
+# Metrics - written at the end of the run (and every METRICS_INTERVAL seconds if > 0)
+# .json → JSON, .prom/.txt → Prometheus text format; None = no file
+METRICS_PATH = None
+METRICS_INTERVAL = 0
+QUIET = False            # True = no per-product console output (summary only)
+PROGRESS_EVERY = 25      # products between progress lines (throughput, concurrency, breaker state)
+
+# Perceptual-hash pre-pass - near-identical catalog images (re-uploads, resized
+# copies) share one Lens lookup; needs Pillow
+IMAGE_DEDUPE = False
+IMAGE_HASH_DISTANCE = 4       # max differing bits (of 64) for two images to count as the same
+IMAGE_FETCH_WORKERS = 16
+IMAGE_FETCH_TIMEOUT = 10
+
+# Record / replay - --record archives every Lens response of a run, --replay re-runs
+# the filters and passes from such an archive offline (no API calls, all cores)
+RECORD_PATH = None
+REPLAY_PROCESSES = None       # None = one per CPU core
+REPLAY_CHUNK_SIZE = 200       # products per task handed to a replay process
+
+# Typed columnar copy of the output (.parquet or .arrow/.feather, needs pyarrow; None = off)
+COLUMNAR_PATH = None
+
+# Manifest of every row's last result across runs (None = off); --delta re-searches
+# only new/changed rows and rows whose result is older than DELTA_MAX_AGE_HOURS
+MANIFEST_PATH = "lens_manifest.sqlite"
+DELTA_MAX_AGE_HOURS = 7 * 24
+
+# Match filter thresholds (threshold_search.py grid-searches them against a labeled catalog)
+RANK_CUTOFF = 15              # only the top N visual matches are considered
+PRICE_TOLERANCE = 0.30        # listing price within ±30% of the catalog price (listings without a price pass)
+MARKETPLACE_SIMILARITY = 3    # min title similarity (0-100) on marketplaces (Myntra, Slikk)
+BRAND_SITE_SIMILARITY = 10    # min title similarity on brand sites
+COLOR_BONUS = 15              # similarity bonus when the match title has a colour of the catalog title
+COLOR_PENALTY = 20            # similarity penalty when it names only other colours
+
+# Match filter chain - re-ordered during the run by observed cost / rejection rate
+ADAPTIVE_FILTER_ORDER = True
+FILTER_REORDER_EVERY = 500    # matches checked between re-orderings
+# Debug: keep checking matches after every site has its candidate, so the rejection
+# counts ("Filtered:" line, filter_rejections_total) are those of a full scan (slower)
+EXACT_FILTER_STATS = False
+
+# Credit budget - cap on SerpAPI credits per run (None = no cap; credits are counted either way)
+CREDIT_BUDGET = None
+MIN_PASS2_GAIN = 0.05         # expected rescued sites below which a budgeted Pass 2 is never worth a credit
+# Product order for budgeted runs - any of "price" (expensive first), "brand"
+# (PRIORITY_BRANDS first, in that order), "unmatched" (not found in a previous output first)
+PRIORITY_KEYS = {"price", "brand", "unmatched"}
+PRIORITY = []
+PRIORITY_BRANDS = []
+
+# Shared work queue (--queue) - several worker processes/machines split one catalog
+QUEUE_LEASE_SECONDS = 300     # a product goes back to the queue if its worker goes silent this long
+QUEUE_MAX_ATTEMPTS = 3        # tries for products whose API calls keep failing (or whose workers crash/hang)
+QUEUE_POLL_SECONDS = 5        # idle workers re-check for expired leases this often
+
+# Site/brand registry - compiled into lookup tables, hot-reloaded when the file changes
+REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "site_registry.json")
+REGISTRY_CHECK_SECONDS = 5
+
+class RateLimiter:
+    """
+    Thread-safe rate limiter shared by all workers
+    Hands out evenly spaced request slots (replaces the fixed sleep between products)
+    """
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the caller may send its next request"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+
+# Single limiter shared by every SerpAPI call in this process
+rate_limiter = RateLimiter(REQUESTS_PER_SECOND)
+
+# Run-wide metrics (latency histograms, filter rejections, pass hit rates, throughput)
+metrics = Metrics()
+
+# Credits spent this run (and the cap, when a budget is set)
+credit_budget = CreditBudget(CREDIT_BUDGET, min_pass2_gain=MIN_PASS2_GAIN)
+
+# Coalesces duplicate image / (image, brand) lookups across workers
+lens_single_flight = SingleFlight(memo_size=SINGLE_FLIGHT_MEMO_SIZE)
+
+def announce(message):
+    """Print a run-level message right away, even from a thread whose output is being captured"""
+    if isinstance(sys.stdout, GroupedConsole):
+        sys.stdout.emit(message + "\n")
+    else:
+        print(message)
+
+def on_flow_event(event, message):
+    metrics.inc("serpapi_flow_events_total", event=event)
+    announce(f"  {message}")
+
+# AIMD limit on in-flight SerpAPI requests (None = fixed, one per fetch worker)
+concurrency = AdaptiveConcurrency(
+    CONCURRENCY_INITIAL,
+    min_limit=CONCURRENCY_MIN,
+    max_limit=MAX_WORKERS,
+    backoff=CONCURRENCY_BACKOFF,
+    latency_tolerance=LATENCY_P95_TOLERANCE,
+    listener=on_flow_event,
+) if ADAPTIVE_CONCURRENCY else None
+
+# Pauses every SerpAPI call while the API keeps failing
+breaker = CircuitBreaker(
+    BREAKER_FAILURE_RATE,
+    window=BREAKER_WINDOW,
+    pause_seconds=BREAKER_PAUSE_SECONDS,
+    max_pause_seconds=BREAKER_MAX_PAUSE_SECONDS,
+    listener=on_flow_event,
+)
+
+# Duplicates slow SerpAPI requests (used when hedging is on)
+hedger = Hedger(HEDGE_PERCENTILE, max_fraction=HEDGE_MAX_PERCENT / 100, workers=2 * HTTP_POOL_SIZE)
+
+# Single pooled transport shared by both Lens search functions
+transport = LensTransport(
+    SERPAPI_URL,
+    pool_size=HTTP_POOL_SIZE,
+    max_retries=HTTP_MAX_RETRIES,
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+    read_timeout=HTTP_READ_TIMEOUT,
+    call_budget=HTTP_CALL_BUDGET,
+    rate_limiter=rate_limiter,
+    concurrency=concurrency,
+    breaker=breaker,
+    hedger=hedger if HEDGE_REQUESTS else None,
+)
+
+class GroupedConsole:
+    """
+    stdout wrapper that keeps each worker's output together
+    While a thread is inside capture(), its prints go to a private buffer
+    that is written out in one piece when the product is done
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is not None:
+            return buffer.write(text)
+        with self._lock:
+            return self.stream.write(text)
+
+    def flush(self):
+        with self._lock:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    @contextmanager
+    def capture(self):
+        buffer = io.StringIO()
+        with self.redirect(buffer):
+            yield buffer
+        self.emit(buffer.getvalue())
+    
+    @contextmanager
+    def redirect(self, buffer):
+        """Send this thread's prints to buffer (e.g. a product's log that moves between threads)"""
+        previous = getattr(self._local, "buffer", None)
+        self._local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = previous
+
+    def emit(self, text):
+        if not text:
+            return
+        with self._lock:
+            self.stream.write(text)
+            self.stream.flush()
+
+@contextmanager
+def grouped_console():
+    """Install GroupedConsole as sys.stdout for the duration of a run"""
+    original = sys.stdout
+    console = GroupedConsole(original)
+    sys.stdout = console
+    try:
+        yield console
+    finally:
+        sys.stdout = original
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Open the shared response cache on first use (None when disabled)"""
+    global _response_cache
+    if not CACHE_ENABLED:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = LensCache(CACHE_PATH, CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES)
+    return _response_cache
+
+# Run-wide pass statistics and the pool that runs speculative Pass 2 calls
+pass_scheduler = PassScheduler(
+    speculate_miss_probability=SPECULATE_MISS_PROBABILITY,
+    skip_rescue_rate=SKIP_PASS2_RESCUE_RATE,
+    min_samples=SCHEDULER_MIN_SAMPLES,
+)
+speculation_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="pass2")
+
+# Single registry watcher shared by all workers
+registry_watcher = RegistryWatcher(REGISTRY_PATH, check_interval=REGISTRY_CHECK_SECONDS)
+
+def get_registry():
+    """Current compiled site/brand registry (reloaded if the file changed)"""
+    return registry_watcher.get()
 
 def get_brand_site(brand_name):
     """
@@ -54,104 +331,9 @@ def get_brand_site(brand_name):
     Returns: brand_site_key or None
     
     ROBUST: Handles all Sassafras sub-brands (Shae, MASCLN, Pink Paprika)
-    and maps them to sassafras.in
+    and maps them to sassafras.in (see brand_sites / brand_site_fallbacks in the registry)
     """
-    # Convert brand name to lowercase for matching
-    # Remove ALL spaces, hyphens, and underscores for consistent matching
-    brand_lower = brand_name.lower().replace(" ", "").replace("-", "").replace("_", "")
-    
-    # Enhanced brand mapping with more variations
-    brand_mapping = {
-        # Bewakoof
-        "bewakoof": "bewakoof",
-        
-        # Sassafras and sub-brands - ALL map to "sassafras"
-        "sassafras": "sassafras",
-        # MASCLN variants
-        "masclnsassafras": "sassafras",
-        "mascln": "sassafras",
-        "masclnbysassafras": "sassafras",
-        "masclnSASSAFRAS": "sassafras",
-        # Shae variants
-        "shaebysassafras": "sassafras",
-        "shae": "sassafras",
-        "shaeSASSAFRAS": "sassafras",
-        "shaesassafras": "sassafras",
-        # Pink Paprika variants
-        "pinkpaprikabysassafras": "sassafras",
-        "pinkpaprika": "sassafras",
-        "pinkpaprikaSASSAFRAS": "sassafras",
-        "pinkpaprikasassafras": "sassafras",
-        
-        # The Indian Garage Co
-        "indiangarageco": "indian_garage_co",
-        "indiangaragecompany": "indian_garage_co",
-        "theindiangaragecompany": "indian_garage_co",
-        "theindiangaragecom": "indian_garage_co",
-        "theindiangarageco": "indian_garage_co",
-        "theindiangarage": "indian_garage_co",
-        "tigc": "indian_garage_co",
-        
-        # Bear House
-        "bearhouse": "bearhouse",
-        "thebearhouse": "bearhouse",
-        "bearhouseindia": "bearhouse",
-        "thebearhouseindia": "bearhouse",
-        
-        # Bear Company
-        "bearcompany": "bearcompany",
-        "thebearcompany": "bearcompany",
-        "bear": "bearcompany",
-        "bearco": "bearcompany",
-        
-        # MyDesignation
-        "mydesignation": "mydesignation",
-        "designation": "mydesignation",
-        
-        # BEEGLEE
-        "beeglee": "beeglee",
-        
-        # Color Capital
-        "colorcapital": "color_capital",
-        
-        # Chapter 2
-        "chapter2": "chapter_2",
-        "chaptertwo": "chapter_2",
-        
-        # QISSA
-        "qissa": "qissa",
-        
-        # MYWISHBAG
-        "mywishbag": "mywishbag",
-        
-        # Campus Sutra
-        "campussutra": "campus_sutra",
-        
-        # Haute Sauce
-        "hautesauce": "haute_sauce",
-        
-        # SILISOUL
-        "silisoul": "silisoul",
-        
-        # Guns & Sons
-        "gunsandsons": "guns_and_sons",
-        "gunssons": "guns_and_sons",
-        "gunsnsons": "guns_and_sons",
-    }
-    
-    # Get brand's own site if it exists in our database
-    brand_site = brand_mapping.get(brand_lower)
-    if brand_site and brand_site in SHOPPING_SITES:
-        return brand_site
-    
-    # FALLBACK: Check if brand contains sassafras-related keywords
-    # This ensures ALL Sassafras sub-brands map to sassafras.in
-    sassafras_keywords = ['sassafras', 'mascln', 'shae', 'paprika']
-    if any(keyword in brand_lower for keyword in sassafras_keywords):
-        if "sassafras" in SHOPPING_SITES:
-            return "sassafras"
-    
-    return None
+    return get_registry().brand_site(brand_name)
 
 def extract_domain(url):
     """Extract clean domain from URL"""
@@ -162,21 +344,54 @@ def extract_domain(url):
     except:
         return ""
 
+# Query parameters that never identify a product (dropped during canonicalization)
+TRACKING_PARAMS = {
+    'gclid', 'gbraid', 'wbraid', 'fbclid', 'msclkid', 'srsltid', 'igshid',
+    'ref', 'ref_', 'mc_cid', 'mc_eid', '_pos', '_sid', '_ss',
+}
+
+@lru_cache(maxsize=65536)
+def canonicalize_url(url):
+    """
+    Canonical form of a product URL so equivalent links dedupe to one candidate
+    - lowercase scheme/host, no "www.", no default port
+    - tracking params (utm_*, gclid, srsltid, ...) and #fragments removed
+    - trailing slash on the path removed
+    """
+    try:
+        parts = urlsplit(url.strip())
+        host = (parts.hostname or "").lower()
+    except ValueError:
+        return url
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    ]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(((parts.scheme or "https").lower(), host, path, urlencode(query), ""))
+
+# Hostname of a URL ([scheme:]//[user@]host[:port]...) without a full urlsplit
+HOST_RE = re.compile(r'(?:[a-zA-Z][a-zA-Z0-9+.-]*:)?//(?:[^@/?#]*@)?([^:/?#@\[\]]*)')
+
 def identify_site(url):
-    """Identify which shopping site the URL belongs to"""
-    domain = extract_domain(url)
-    url_lower = url.lower()
-    
-    for site_key, site_patterns in SHOPPING_SITES.items():
-        for pattern in site_patterns:
-            if pattern in domain or pattern in url_lower:
-                return site_key
-    return None
+    """Identify which shopping site the URL belongs to (hostname only, never the query string)"""
+    found = HOST_RE.match(url)
+    if not found:
+        return None
+    host = found.group(1).lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return get_registry().identify_host(host)
 
 def extract_price_from_match(match_data):
     """
     Extract price from match data - handles all possible price formats from SerpAPI
-    Returns only numeric values without currency symbols
+    Returns only numeric values without currency symbols (None when the listing shows no price)
     """
     price_info = match_data.get("price", {})
     
@@ -202,20 +417,26 @@ def extract_price_from_match(match_data):
             if cleaned and cleaned.replace('.', '').isdigit():
                 return cleaned
     
-    return "Price not displayed in listing"
+    return None
+
+# Colour vocabulary - matched as whole words only ("tan" must not hit "tank")
+COLOR_WORDS = [
+    'black', 'white', 'blue', 'red', 'green', 'yellow', 'pink', 'purple', 
+    'orange', 'brown', 'grey', 'gray', 'beige', 'navy', 'olive', 'maroon',
+    'silver', 'gold', 'cream', 'khaki', 'tan', 'teal', 'burgundy', 'mint',
+    'lavender', 'coral', 'peach', 'mustard', 'charcoal', 'rose'
+]
+COLOR_RE = re.compile(r'\b(?:' + '|'.join(COLOR_WORDS) + r')\b')
+
+@lru_cache(maxsize=65536)
+def title_colors(title):
+    """Set of colour words in a title (cached per title)"""
+    return frozenset(COLOR_RE.findall(title.lower()))
 
 def extract_colors_from_title(title):
     """Extract color keywords from title"""
-    colors = [
-        'black', 'white', 'blue', 'red', 'green', 'yellow', 'pink', 'purple', 
-        'orange', 'brown', 'grey', 'gray', 'beige', 'navy', 'olive', 'maroon',
-        'silver', 'gold', 'cream', 'khaki', 'tan', 'teal', 'burgundy', 'mint',
-        'lavender', 'coral', 'peach', 'mustard', 'charcoal', 'rose'
-    ]
-    
-    title_lower = title.lower()
-    found_colors = [c for c in colors if c in title_lower]
-    return found_colors
+    found = title_colors(title)
+    return [c for c in COLOR_WORDS if c in found]
 
 def check_brand_relaxed_match(match, target_brand, site_key):
     """
@@ -224,145 +445,91 @@ def check_brand_relaxed_match(match, target_brand, site_key):
     - Marketplaces: Require brand in title OR URL
     Returns True if brand match is acceptable
     """
-    title = match.get("title", "").lower()
-    link = match.get("link", "").lower()
-    source = match.get("source", "").lower()
+    registry = get_registry()
     
     # If product is on brand's own website, skip brand verification
-    if site_key and site_key not in ['myntra', 'slikk']:
+    if site_key and not registry.is_marketplace(site_key):
         return True
     
-    # For marketplaces, check brand presence
-    target_lower = target_brand.lower()
-    
-    # Generate brand variations to check
-    brand_keywords = target_lower.replace("-", " ").replace("_", " ").split()
-    
-    brand_variations = [
-        target_lower.replace(" ", ""),
-        target_lower.replace(" ", "-"),
-        target_lower.replace(" ", "_"),
-        target_lower,
-    ]
-    
-    if len(brand_keywords) > 1:
-        combined = "".join(brand_keywords)
-        brand_variations.append(combined)
-        
-        if brand_keywords[0] in ["the"]:
-            without_the = " ".join(brand_keywords[1:])
-            brand_variations.append(without_the)
-            brand_variations.append(without_the.replace(" ", ""))
-    
-    # Special brand-specific variations
-    if "bear" in target_lower:
-        brand_variations.extend([
-            "bear", "bearhouse", "bear house", "thebearhouse", "the bear house",
-            "bearcompany", "bear company", "thebearcompany", "the bear company",
-        ])
-    
-    if "bewakoof" in target_lower:
-        brand_variations.extend(["bewakoof", "bwkf"])
+    matcher = registry.brand_matcher(target_brand)
+    if matcher is None:
+        return False
     
-    if "indian" in target_lower and "garage" in target_lower:
-        brand_variations.extend(["indiangarage", "indian garage", "tigc"])
-    
-    if "sassafras" in target_lower or "mascln" in target_lower or "shae" in target_lower or "pink paprika" in target_lower:
-        brand_variations.extend([
-            "sassafras", "mascln", "shae", "pink paprika"
-        ])
-    
-    if "mydesignation" in target_lower:
-        brand_variations.extend(["mydesignation", "my designation", "designation"])
-    
-    if "beeglee" in target_lower:
-        brand_variations.extend(["beeglee", "bee glee"])
-    
-    if "chapter" in target_lower:
-        brand_variations.extend(["chapter2", "chapter 2", "chapter two"])
-    
-    if "campus" in target_lower:
-        brand_variations.extend(["campussutra", "campus sutra"])
-    
-    if "guns" in target_lower or "sons" in target_lower:
-        brand_variations.extend(["guns", "sons", "gunsnsons", "guns & sons"])
-    
-    # Check if ANY brand variation exists in title, link, or source
-    combined_text = f"{title} {link} {source}"
-    
-    for variation in brand_variations:
-        if variation and len(variation) > 2 and variation in combined_text:
-            return True
-    
-    return False
+    # Check if ANY brand variation exists in title, link, or source (one pass)
+    combined_text = f"{match.get('title', '')} {match.get('link', '')} {match.get('source', '')}".lower()
+    return matcher.search(combined_text) is not None
 
 def is_valid_product_url(url):
     """
     STRICT URL validation - reject category/collection/search pages
     Returns True for actual product pages only
+    Data-driven: invalid_url_patterns + per-site product_path in the registry
     """
+    registry = get_registry()
     url_lower = url.lower()
     
-    # Invalid patterns - these indicate non-product pages
-    invalid_patterns = [
-        '/collections/', '/collection/', '/category/', '/categories/',
-        '/search', '?search=', '/s?', '/find/',
-        '/brand/', '/brands/', '/sale/', '/deals/',
-        '/all-products', '/shop?',
-        '/filter', '/sort=',
-        '?page=', '&page=',  # Pagination
-        '/men/', '/women/', '/kids/', '/unisex/',
-        '/clothing/', '/accessories/', '/footwear/'
-    ]
-    
     # Check for invalid patterns
-    for pattern in invalid_patterns:
-        if pattern in url_lower:
-            return False
+    if registry.invalid_url_re.search(url_lower):
+        return False
     
     # Site-specific validations
-    if 'bewakoof.com' in url_lower:
-        return '/p/' in url_lower or '/product/' in url_lower or '/buy' in url_lower
-    elif 'myntra.com' in url_lower:
-        return '/buy' in url_lower or '/p/' in url_lower
-    elif 'slikk.club' in url_lower:
-        return True  # Accept all Slikk URLs after invalid pattern check
-    elif 'mydesignation.com' in url_lower:
-        return '/products/' in url_lower
-    elif 'sassafras.in' in url_lower:
-        return '/products/' in url_lower
-    elif 'bearhouse' in url_lower or 'bearcompany' in url_lower or 'thebearhouse' in url_lower:
-        return '/products/' in url_lower or '/product/' in url_lower
-    elif 'tigc.in' in url_lower:
-        return '/products/' in url_lower
-    elif 'beeglee.in' in url_lower:
-        return '/products/' in url_lower or '/product/' in url_lower
-    elif 'colorcapital.in' in url_lower:
-        return '/products/' in url_lower or '/product/' in url_lower
-    elif 'chapter2drip.com' in url_lower:
-        return '/products/' in url_lower or '/product/' in url_lower
-    elif 'shopqissa.com' in url_lower:
-        return '/products/' in url_lower or '/product/' in url_lower
-    elif 'mywishbag.com' in url_lower:
-        return '/products/' in url_lower or '/product/' in url_lower
-    elif 'campussutra.com' in url_lower:
-        return '/products/' in url_lower or '/product/' in url_lower
-    elif 'buyhautesauce.com' in url_lower:
-        return '/products/' in url_lower or '/product/' in url_lower
-    elif 'silisoul.com' in url_lower:
-        return '/products/' in url_lower or '/product/' in url_lower
-    elif 'gunsnsons.com' in url_lower:
-        return '/products/' in url_lower or '/product/' in url_lower
+    try:
+        host = urlsplit(url_lower).hostname or ""
+    except ValueError:
+        host = ""
+    matched, rule = registry.product_rule(host)
+    if matched:
+        return rule is None or rule.search(url_lower) is not None
     
     # Generic validation: Accept URLs with 3+ meaningful path segments
     path_segments = [s for s in url_lower.split('/') if s and not s.startswith('?')]
     return len(path_segments) >= 3
 
+def run_lens_search(params):
+    """
+    Send one Google Lens request through request coalescing and the local response cache
+    Identical lookups (same image, query, country, hl) in flight at the same time,
+    or repeated within the run, share one request and one parsed response -
+    callers must treat the returned payload as read-only
+    Returns {"visual_matches": [...]} (trimmed, possibly empty)
+    or None when the API call failed after all retries
+    """
+    cache_key = make_cache_key(params["engine"], params["url"], params.get("q"), params["country"], params["hl"])
+    return lens_single_flight.do(cache_key, lambda: _fetch_lens_search(params, cache_key))
+
+def _fetch_lens_search(params, cache_key):
+    cache = get_response_cache()
+    
+    pass_label = "2" if params.get("q") else "1"
+    
+    if cache and not FORCE_FRESH:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            metrics.inc("serpapi_cache_hits_total", **{"pass": pass_label})
+            return cached
+    
+    started = time.monotonic()
+    try:
+        data = transport.get_json(params)
+    except LensTransportError as e:
+        metrics.inc("serpapi_requests_total", **{"pass": pass_label, "result": "error"})
+        print(f"  ❌ API Error after {e.attempts} attempt(s): {str(e)}")
+        return None
+    finally:
+        metrics.observe("serpapi_latency_seconds", time.monotonic() - started, **{"pass": pass_label})
+    metrics.inc("serpapi_requests_total", **{"pass": pass_label, "result": "ok"})
+    credit_budget.spend(pass_label)
+    
+    result = {"visual_matches": trim_visual_matches(data.get("visual_matches", []))}
+    if cache:
+        cache.put(cache_key, result)
+    return result
+
 def search_image_on_serpapi(image_url):
     """
     Search for visually similar products using SerpAPI Google Lens
     PURE IMAGE SEARCH - No text query
-    FRESH DATA - No cache
+    FRESH DATA - No SerpAPI cache (local cache, see CACHE_* settings)
     """
     params = {
         "engine": "google_lens",
@@ -373,20 +540,14 @@ def search_image_on_serpapi(image_url):
         "no_cache": "true"
     }
     
-    try:
-        response = requests.get("https://serpapi.com/search", params=params, timeout=60)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"  ❌ API Error: {str(e)}")
-        return None
+    return run_lens_search(params)
 
 def search_image_with_query_on_serpapi(image_url, brand_query):
     """
     Search with Image + Brand Query ONLY
     Let Google return ALL brand products, we filter locally
-    FRESH DATA - No cache
-    INCREASED TIMEOUT - 60 seconds to avoid timeouts
+    FRESH DATA - No SerpAPI cache (local cache, see CACHE_* settings)
+    TIMEOUTS - per-attempt + per-call budget with retries (see HTTP_* settings)
     """
     params = {
         "engine": "google_lens",
@@ -398,13 +559,126 @@ def search_image_with_query_on_serpapi(image_url, brand_query):
         "no_cache": "true"
     }
     
-    try:
-        response = requests.get("https://serpapi.com/search", params=params, timeout=60)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"  ❌ API Error: {str(e)}")
-        return None
+    return run_lens_search(params)
+
+# Archive being recorded (process_products with record_path) / replayed (replay worker processes)
+record_archive = None
+replay_archive = None
+
+def lens_lookup(job, pass_label):
+    """
+    The Lens lookup of one pass for a job's product - "1" image only, "2" image + brand query
+    Replays answer from the archive without any network call; recording runs
+    archive every successful response under (style_id, pass)
+    """
+    product = job['product']
+    if replay_archive is not None:
+        return replay_archive.get(product['style_id'], pass_label)
+    if pass_label == "1":
+        response = search_image_on_serpapi(job['lens_image'])
+    else:
+        response = search_image_with_query_on_serpapi(job['lens_image'], job['brand_for_query'])
+    if response is not None and record_archive is not None:
+        record_archive.append(product['style_id'], pass_label, response)
+    return response
+
+# Image URL -> URL of the near-identical image whose Lens lookup it reuses
+image_aliases = {}
+
+def build_image_aliases(image_urls, max_distance=IMAGE_HASH_DISTANCE):
+    """
+    Perceptual-hash pre-pass: download every image (pooled, concurrent), dHash it
+    and map each URL to the first earlier image within max_distance bits
+    image_urls: one entry per product that will be searched (repeats allowed)
+    Pass 1 lookups of shared images are pinned until every product using them
+    has been served, so each group costs one Lens call
+    """
+    unique_urls = list(dict.fromkeys(image_urls))
+    started = time.monotonic()
+    hashes = ImageFetcher(IMAGE_FETCH_WORKERS, IMAGE_FETCH_TIMEOUT).hash_all(unique_urls)
+    hashed = [(url, hash_value) for url, hash_value in hashes.items() if hash_value is not None]
+    aliases = {url: rep for url, rep in group_near_duplicates(hashed, max_distance).items() if rep != url}
+    
+    uses = {}
+    for url in image_urls:
+        lens_url = aliases.get(url, url)
+        uses[lens_url] = uses.get(lens_url, 0) + 1
+    for lens_url, count in uses.items():
+        if count > 1:
+            lens_single_flight.pin(make_cache_key("google_lens", lens_url, None, "in", "en"), count)
+    
+    print(f"🖼 IMAGE DEDUPE: {len(unique_urls)} image(s) hashed in {time.monotonic() - started:.1f}s "
+          f"({len(unique_urls) - len(hashed)} unreadable) → {len(uses)} Lens lookup(s) "
+          f"for {len(image_urls)} product(s), {len(aliases)} near-duplicate image(s)")
+    return aliases
+
+# Title similarity - words that carry no product information
+STOP_WORDS = frozenset({'the', 'a', 'an', 'and', 'or', 'but', 'with', 'for', 'on', 'in', 'at', 'to', 'buy', 'shop', 'online'})
+TOKEN_RE = re.compile(r'\b\w+\b')
+
+@lru_cache(maxsize=65536)
+def title_keywords(title):
+    """Keyword set of a title, tokenized once and cached (repeated match titles are free)"""
+    return frozenset(TOKEN_RE.findall(title.lower())) - STOP_WORDS
+
+def title_features(original_title):
+    """
+    Threshold-free parts of the title similarity for one product title:
+    found_title -> (keyword overlap 0-100, colour match: 1 same / -1 other / 0 none),
+    or None when either title has nothing to compare (similarity 0)
+    The original title is tokenized and colour-scanned once, however many
+    candidate titles are compared with it
+    """
+    orig_keywords = title_keywords(original_title) if original_title else frozenset()
+    if not orig_keywords:
+        return lambda found_title: None
+    orig_colors = title_colors(original_title)
+    
+    def features(found_title):
+        if not found_title:
+            return None
+        
+        # Calculate keyword overlap
+        common_keywords = orig_keywords & title_keywords(found_title)
+        overlap_score = (len(common_keywords) / len(orig_keywords)) * 100
+        
+        color_match = 0
+        if orig_colors:
+            found_colors = title_colors(found_title)
+            if orig_colors & found_colors:
+                color_match = 1
+            elif found_colors:
+                color_match = -1
+        return overlap_score, color_match
+    return features
+
+def title_scorer(original_title):
+    """Similarity function for one product title: found_title -> score (0-100)"""
+    features = title_features(original_title)
+    
+    def score(found_title):
+        parts = features(found_title)
+        if parts is None:
+            return 0
+        overlap_score, color_match = parts
+        
+        # Color match bonus/penalty
+        color_bonus = 0
+        if color_match > 0:
+            color_bonus = COLOR_BONUS  # Bonus for matching color
+        elif color_match < 0:
+            color_bonus = -COLOR_PENALTY  # Penalty for wrong color
+        
+        return min(100, max(0, overlap_score + color_bonus))
+    return score
+
+def score_titles(original_title, found_titles):
+    """
+    Batch similarity: score one product title against all of its candidate titles
+    Returns a list of scores (0-100) aligned with found_titles
+    """
+    score = title_scorer(original_title)
+    return [score(found_title) for found_title in found_titles]
 
 def calculate_title_similarity(original_title, found_title):
     """
@@ -412,40 +686,90 @@ def calculate_title_similarity(original_title, found_title):
     Returns a score between 0-100
     Includes color matching bonus/penalty
     """
-    if not original_title or not found_title:
-        return 0
-    
-    # Normalize titles
-    orig_lower = original_title.lower()
-    found_lower = found_title.lower()
-    
-    # Extract keywords (ignore common words)
-    stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'with', 'for', 'on', 'in', 'at', 'to', 'buy', 'shop', 'online'}
-    
-    orig_keywords = set(re.findall(r'\b\w+\b', orig_lower)) - stop_words
-    found_keywords = set(re.findall(r'\b\w+\b', found_lower)) - stop_words
-    
-    if not orig_keywords:
-        return 0
-    
-    # Calculate keyword overlap
-    common_keywords = orig_keywords & found_keywords
-    overlap_score = (len(common_keywords) / len(orig_keywords)) * 100
-    
-    # Extract and compare colors
-    orig_colors = extract_colors_from_title(orig_lower)
-    found_colors = extract_colors_from_title(found_lower)
-    
-    # Color match bonus/penalty
-    color_bonus = 0
-    if orig_colors:
-        if any(c in found_colors for c in orig_colors):
-            color_bonus = 15  # Bonus for matching color
-        elif found_colors:
-            color_bonus = -20  # Penalty for wrong color
-    
-    final_score = min(100, max(0, overlap_score + color_bonus))
-    return final_score
+    return title_scorer(original_title)(found_title)
+
+# === MATCH FILTERS ===
+# Each filter is check(match, site_key, link, title, context) -> keep?
+# context holds the product attributes prepared once per extract_product_info call.
+# They are independent, so the chain may run them in any order.
+
+CATEGORY_KEYWORDS = {
+    'shirts': ['shirt'],
+    't-shirts': ['tshirt', 't-shirt', 'tee'],
+    'jeans': ['jean'],
+    'trousers': ['trouser', 'pant'],
+    'kurtas': ['kurta', 'kurti'],
+    'dresses': ['dress'],
+    'tops': ['top', 'bodysuit', 'corset', 'cami', 'tank', 'crop'],
+    'jackets': ['jacket', 'blazer'],
+    'sweatshirts': ['sweatshirt', 'sweater', 'hoodie'],
+    'skirts': ['skirt'],
+}
+# Categories whose titles are too varied to require a keyword
+CATEGORY_MATCH_EXEMPT = {'other sets', 'onesies', 'glasses', 'caps'}
+
+def category_keywords_for(category):
+    """Title keywords any of which proves the category (None = no category check)"""
+    if not category or category in CATEGORY_MATCH_EXEMPT:
+        return None
+    return tuple(kw for cat_key, cat_keywords in CATEGORY_KEYWORDS.items() if cat_key in category for kw in cat_keywords)
+
+def brand_filter(match, site_key, link, title, context):
+    return check_brand_relaxed_match(match, context['brand'], site_key)
+
+def url_filter(match, site_key, link, title, context):
+    return is_valid_product_url(link)
+
+def category_filter(match, site_key, link, title, context):
+    keywords = context['category_keywords']
+    return keywords is None or any(kw in title for kw in keywords)
+
+def price_deviation(match, original_price):
+    """|listing price - catalog price| / catalog price, or None when there is nothing to compare"""
+    if original_price <= 0:
+        return None
+    price_str = extract_price_from_match(match)
+    if price_str is None:
+        return None
+    try:
+        found_price = float(price_str)
+    except ValueError:
+        return None
+    return abs(found_price - original_price) / original_price
+
+def price_filter(match, site_key, link, title, context):
+    """±PRICE_TOLERANCE of the catalog price; listings without a usable price pass"""
+    deviation = price_deviation(match, context['price'])
+    return deviation is None or deviation <= PRICE_TOLERANCE
+
+def similarity_filter(match, site_key, link, title, context):
+    # Lower thresholds since we have stricter rank/category/price filters
+    threshold = MARKETPLACE_SIMILARITY if context['registry'].is_marketplace(site_key) else BRAND_SITE_SIMILARITY
+    context['similarity'] = context['score_title'](title)  # kept for the candidate a passing match becomes
+    return context['similarity'] >= threshold
+
+# Initial order: cheap and selective first; re-sorted by observed cost / rejection rate.
+# Rejections are always counted in the original brand → url → category → price → similarity order.
+match_filters = FilterChain([
+    ('category', category_filter),
+    ('price', price_filter),
+    ('brand', brand_filter),
+    ('url', url_filter),
+    ('similarity', similarity_filter),
+], adaptive=ADAPTIVE_FILTER_ORDER, reorder_every=FILTER_REORDER_EVERY,
+   report_order=['brand', 'url', 'category', 'price', 'similarity'])
+
+def filter_context(target_brand, original_product):
+    """Product attributes the match filters read, prepared once per product"""
+    original_title = original_product.get('product_title', '')
+    original_price = float(original_product.get('min_price_rupees', 0)) if original_product.get('min_price_rupees') else 0
+    return {
+        'brand': target_brand,
+        'registry': get_registry(),
+        'category_keywords': category_keywords_for(original_product.get('category', '').lower()),
+        'price': original_price,
+        'score_title': title_scorer(original_title),
+    }
 
 def extract_product_info(visual_matches, target_brand, allowed_sites, original_product, pass_type="first"):
     """
@@ -453,190 +777,193 @@ def extract_product_info(visual_matches, target_brand, allowed_sites, original_p
     NEW APPROACH: Get all results from Google, filter locally with strict criteria
     
     Local Filtering:
-    - Visual Rank: Top 15 only (reject low ranks)
+    - Visual Rank: Top RANK_CUTOFF only (reject low ranks)
     - Category: Keyword match (mandatory)
     - Gender: Flexible (Men/Unisex, Women/Unisex ok)
-    - Price: ±30% validation (if available)
+    - Price: ±PRICE_TOLERANCE validation (if available)
     - Title: 10-20% similarity (less important now)
     - Brand: Relaxed verification
+    
+    Matches are checked in rank order through match_filters, which stops at
+    the first rejecting filter; the first match of a site that passes every
+    filter is its best (lowest-rank) candidate. Later matches of a settled site
+    are skipped and checking stops once every site is settled, so the rejection
+    counts cover the checked matches only (plus every match past RANK_CUTOFF)
+    - EXACT_FILTER_STATS checks them all.
     """
-    results = {}
-    for site_key in allowed_sites:
-        results[site_key] = {
-            "url": "Not Found",
-            "price": "Product not available on site",
-        }
+    results = {site_key: SiteResult() for site_key in allowed_sites}
     
     if not visual_matches:
         return results, 0, 0
     
-    brand_matches = 0
-    rejected = 0
-    rejected_similarity = 0
-    rejected_rank = 0
-    rejected_category = 0
-    rejected_price = 0
+    # Extract original product attributes for filtering (once per call)
+    context = filter_context(target_brand, original_product)
     
-    # Extract original product attributes for filtering
-    original_title = original_product.get('product_title', '')
-    original_gender = original_product.get('gender', '').lower()
-    original_category = original_product.get('category', '').lower()
-    original_price = float(original_product.get('min_price_rupees', 0)) if original_product.get('min_price_rupees') else 0
+    # Rejections per filter (a match is counted against the first filter, in report order, that rejects it),
+    # and per (filter, site) for the metrics - flushed once per call
+    rejected_by = {'rank': 0, 'brand': 0, 'url': 0, 'category': 0, 'price': 0, 'similarity': 0}
+    rejections = {}
     
-    # Process each match and collect candidates
-    candidates = {site_key: [] for site_key in allowed_sites}
+    def reject(filter_name, site):
+        rejected_by[filter_name] += 1
+        key = (("filter", filter_name), ("site", site or "other"))
+        rejections[key] = rejections.get(key, 0) + 1
     
-    for idx, match in enumerate(visual_matches, 1):
+    pending = set(allowed_sites)
+    best = {}
+    
+    # === FILTER 1: Visual Rank (Top RANK_CUTOFF only) ===
+    for idx, match in enumerate(visual_matches[:RANK_CUTOFF], 1):
         link = match.get("link", "")
-        match_title = match.get("title", "").lower()
-        
         if not link:
             continue
         
-        # === FILTER 1: Visual Rank (Top 15 only) ===
-        if idx > 15:
-            rejected_rank += 1
-            continue
-        
         site_key = identify_site(link)
-        if not site_key or site_key not in allowed_sites:
-            continue
-        
-        # === FILTER 2: Brand Verification ===
-        if not check_brand_relaxed_match(match, target_brand, site_key):
-            rejected += 1
-            continue
+        if site_key not in pending and (site_key not in allowed_sites or not EXACT_FILTER_STATS):
+            continue  # not searched, or already has its lowest-rank candidate
         
-        # === FILTER 3: URL Validation ===
-        if not is_valid_product_url(link):
+        # === FILTERS 2-6: brand, URL, category, price, similarity (chain order) ===
+        # (on the link as listed - the canonical form only keys the candidate)
+        match_title = match.get("title", "").lower()
+        failed = match_filters.run(match, site_key, link, match_title, context)
+        if failed:
+            reject(failed, site_key)
             continue
         
-        # === FILTER 4: Category Match (MANDATORY) ===
-        category_keywords = {
-            'shirts': ['shirt'],
-            't-shirts': ['tshirt', 't-shirt', 'tee'],
-            'jeans': ['jean'],
-            'trousers': ['trouser', 'pant'],
-            'kurtas': ['kurta', 'kurti'],
-            'dresses': ['dress'],
-            'tops': ['top', 'bodysuit', 'corset', 'cami', 'tank', 'crop'],
-            'jackets': ['jacket', 'blazer'],
-            'sweatshirts': ['sweatshirt', 'sweater', 'hoodie'],
-            'skirts': ['skirt'],
-        }
-        
-        category_match = False
-        if original_category:
-            for cat_key, cat_keywords in category_keywords.items():
-                if cat_key in original_category:
-                    if any(kw in match_title for kw in cat_keywords):
-                        category_match = True
-                        break
-            
-            # If category specified but no match, reject
-            if not category_match and original_category not in ['other sets', 'onesies', 'glasses', 'caps']:
-                rejected_category += 1
-                continue
-        
-        # === FILTER 5: Price Validation (±30% tolerance) ===
-        price_str = extract_price_from_match(match)
-        price_valid = True
-        
-        if original_price > 0 and price_str not in ["Price not displayed in listing", "Product not available on site", "Check site for price"]:
-            try:
-                found_price = float(price_str)
-                price_diff = abs(found_price - original_price) / original_price
-                
-                # Reject if price difference > 30%
-                if price_diff > 0.30:
-                    rejected_price += 1
-                    price_valid = False
-                    continue
-            except:
-                pass  # If price parsing fails, accept the match
-        
-        # === FILTER 6: Title Similarity (Now less important) ===
-        similarity_score = calculate_title_similarity(original_title, match_title)
-        
-        # Lower thresholds since we have stricter rank/category/price filters
-        is_marketplace = site_key in ['myntra', 'slikk']
-        
-        if is_marketplace:
-            similarity_threshold = 3  # Very low for marketplaces
-        else:
-            similarity_threshold = 10  # Low for brand sites
-        
-        if similarity_score < similarity_threshold:
-            rejected_similarity += 1
+        # === PASSED ALL FILTERS - the first is the site's best candidate ===
+        # (equivalent URLs - tracking params, fragments - are one candidate: a later
+        # passing copy never displaces it, a copy rejected for its own title/price never counts)
+        if site_key in pending:
+            best[site_key] = Candidate(site_key, idx, canonicalize_url(link), match, match_title,
+                                       context['similarity'])
+            pending.discard(site_key)
+            if not pending and not EXACT_FILTER_STATS:
+                break
+    
+    for match in visual_matches[RANK_CUTOFF:]:
+        link = match.get("link", "")
+        if link:
+            reject("rank", identify_site(link))
+    
+    metrics.add_counts("filter_rejections_total", rejections, **{"pass": "2" if pass_type == "second" else "1"})
+    
+    # Lowest visual rank wins (most visually similar) - category, price, etc. are already filtered
+    for site_key in allowed_sites:
+        candidate = best.get(site_key)
+        if candidate is None:
             continue
+        price = extract_price_from_match(candidate.match)
+        results[site_key] = SiteResult(candidate.url, price)
         
-        # === PASSED ALL FILTERS - Add to candidates ===
-        candidates[site_key].append({
-            "url": link,
-            "price": price_str,
-            "visual_rank": idx,
-            "similarity": similarity_score,
-            "title": match_title
-        })
-    
-    # Select BEST candidate for each site
-    # NEW LOGIC: Prioritize lower rank (more visually similar)
-    for site_key in allowed_sites:
-        if candidates[site_key]:
-            # Simply pick the lowest visual rank (most visually similar)
-            # Since we already filtered by category, price, etc., rank is most important
-            best_match = min(candidates[site_key], key=lambda x: x['visual_rank'])
-            
-            results[site_key] = {
-                "url": best_match["url"],
-                "price": best_match["price"]
-            }
-            
-            brand_matches += 1
-            
-            # Display result with filtering stats
-            site_display = site_key.upper().replace("_", " ")
-            rank = best_match["visual_rank"]
-            similarity = best_match["similarity"]
-            price_display = f"₹{best_match['price']}" if best_match["price"] not in ["Price not displayed in listing", "Product not available on site", "Check site for price"] else "Check site"
-            pass_indicator = "🔄" if pass_type == "second" else "✓"
-            print(f"      {pass_indicator} {site_display}: Rank #{rank} | Match {similarity:.0f}% | Price: {price_display}")
+        # Display result with filtering stats
+        site_display = site_key.upper().replace("_", " ")
+        price_display = f"₹{price}" if price is not None else "Check site"
+        pass_indicator = "🔄" if pass_type == "second" else "✓"
+        print(f"      {pass_indicator} {site_display}: Rank #{candidate.rank} | Match {candidate.similarity:.0f}% | Price: {price_display}")
     
     # Debug info for rejections
     if pass_type == "second":
-        total_rejected = rejected + rejected_rank + rejected_category + rejected_price + rejected_similarity
+        total_rejected = sum(rejected_by.values()) - rejected_by['url']
         if total_rejected > 0:
-            print(f"      Filtered: {total_rejected} (rank>{rejected_rank}, cat={rejected_category}, price={rejected_price}, sim={rejected_similarity})")
+            print(f"      Filtered: {total_rejected} (rank>{rejected_by['rank']}, cat={rejected_by['category']}, "
+                  f"price={rejected_by['price']}, sim={rejected_by['similarity']})")
     
-    return results, brand_matches, rejected
+    return results, len(best), rejected_by['brand']
 
-def process_single_product(product, product_idx, total_products):
-    """
-    Process a single product with 2-pass search strategy
-    Returns: dict with site_results
-    """
+def timed_call(func, *args):
+    """Run func(*args) and return (result, elapsed seconds)"""
+    started = time.monotonic()
+    result = func(*args)
+    return result, time.monotonic() - started
+
+# === PRODUCT STEPS ===
+# A product moves through these steps as a "job" dict; job['next'] names the
+# next step. process_single_product runs them back to back, the staged
+# pipeline in process_products runs fetch_* on network workers and
+# filter_* on CPU workers.
+
+def start_product(product, product_idx, total_products):
+    """Print the product header and decide which sites to search"""
     print(f"\n[{product_idx}/{total_products}] {product['product_title'][:60]}... ({product['brand']})")
     
+    job = {
+        'product': product,
+        'idx': product_idx,
+        'brand_site': None,
+        'site_results': {},
+        'status': None,
+        'pass2_future': None,
+        'next': 'fetch_pass1',
+    }
+    
     if not product['image']:
         print("  ⚠ No image URL - Skipping")
-        return {'product': product, 'site_results': {}, 'brand_site': None}
+        job['status'] = 'no_image'
+        job['next'] = 'done'
+        return job
     
     # Determine which sites to search for this product
-    brand_site = get_brand_site(product['brand'])
-    allowed_sites = PRIMARY_SITES.copy()
+    registry = get_registry()
+    brand_site = registry.brand_site(product['brand'])
+    allowed_sites = registry.primary_sites.copy()
     if brand_site:
         allowed_sites.append(brand_site)
     
+    job['brand_site'] = brand_site
+    job['allowed_sites'] = allowed_sites
+    # For sassafras sub-brands, use just "SASSAFRAS" (registry query_overrides)
+    job['brand_for_query'] = registry.query_brand(product['brand'])
+    # Near-duplicate images are searched through their group's representative
+    job['lens_image'] = image_aliases.get(product['image'], product['image'])
+    
+    if not credit_budget.start_product():
+        print("  ⛔ Credit budget used up - Skipping")
+        job['status'] = 'budget_exhausted'
+        job['next'] = 'done'
+        return job
+    
     print(f"  🔍 Searching: {', '.join([s.upper() for s in allowed_sites])}")
+    if job['lens_image'] != product['image']:
+        print(f"  🖼 Near-identical to an earlier image - sharing its Lens results")
+    return job
+
+def fetch_pass1(job):
+    """Network step - Pass 1 pure image search (Pass 2 fired alongside when scheduled)"""
+    product = job['product']
     
-    # === PASS 1: Pure image search ===
-    search_results = search_image_on_serpapi(product['image'])
+    # Pass 2 only sends the brand, so it can be fired before Pass 1 finishes
+    # (not on a credit budget - a speculative credit may turn out unneeded)
+    if ADAPTIVE_PASSES and credit_budget.limit is None and replay_archive is None and \
+            pass_scheduler.plan(product['brand'], job['allowed_sites']) == "speculate":
+        print(f"  ⚡ Pass 2 sent speculatively (Pass 1 usually misses for this brand)")
+        job['pass2_future'] = speculation_pool.submit(timed_call, lens_lookup, job, "2")
     
-    if not search_results:
-        print("  ⚠ No API results")
-        return {'product': product, 'site_results': {}, 'brand_site': brand_site}
+    # === PASS 1: Pure image search ===
+    try:
+        job['search_results'], job['pass1_seconds'] = timed_call(lens_lookup, job, "1")
+    finally:
+        credit_budget.release()  # the Pass 1 credit held in start_product
+    job['next'] = 'filter_pass1'
+
+def filter_pass1(job):
+    """CPU step - filter Pass 1 matches and decide whether Pass 2 is needed"""
+    product = job['product']
+    allowed_sites = job['allowed_sites']
+    search_results = job.pop('search_results')
+    pass2_future = job['pass2_future']
+    job['next'] = 'done'
+    
+    if search_results is None:
+        print("  ❌ Pass 1 API failure - product not searched")
+        if pass2_future:
+            pass2_future.cancel()
+        job['status'] = 'api_error'
+        return
     
     visual_matches = search_results.get("visual_matches", [])
+    job['status'] = "ok" if visual_matches else "no_results"
+    if not visual_matches:
+        print("  ⚠ No visual matches from Lens")
     
     site_results, brand_matches, rejected = extract_product_info(
         visual_matches, 
@@ -645,62 +972,164 @@ def process_single_product(product, product_idx, total_products):
         product,  # Pass full product dict for local filtering
         pass_type="first"
     )
+    job['site_results'] = site_results
     
-    sites_found = sum(1 for site_data in site_results.values() if site_data["url"] != "Not Found")
+    sites_found = sum(1 for site_result in site_results.values() if site_result.found)
     print(f"  💾 Pass 1: Found on {sites_found}/{len(allowed_sites)} site(s)")
     
     # === PASS 2: Image + Brand Query ONLY (local filtering) ===
-    sites_missing = [s for s in allowed_sites if site_results.get(s, {}).get('url') == "Not Found"]
+    sites_missing = [s for s in allowed_sites if not site_results.get(s, NOT_FOUND).found]
+    job['sites_missing'] = sites_missing
+    job['pass1_found'] = [s for s in allowed_sites if s not in sites_missing]
+    job['pass2_searched'] = None
+    job['pass2_found'] = []
+    
+    if not sites_missing and pass2_future:
+        # Pass 1 covered everything - the speculative credit was not needed
+        if not pass2_future.cancel():
+            pass_scheduler.record_pass2(wasted=True)
+    elif sites_missing and replay_archive is not None and not replay_archive.has(product['style_id'], "2"):
+        # The recorded run skipped Pass 2 (or it failed) - nothing to replay
+        print(f"  ⏭ Pass 2 not in the replay archive")
+    elif sites_missing and not pass2_future and ADAPTIVE_PASSES and replay_archive is None and \
+            not pass_scheduler.should_run_pass2(product['brand'], sites_missing):
+        print(f"  ⏭ Pass 2 skipped (it has not been finding {', '.join(s.upper() for s in sites_missing)} for this brand)")
+        pass_scheduler.record_pass2(skipped=True)
+    elif sites_missing and credit_budget.limit is not None:
+        # Budgeted run: spend a Pass 2 credit only where it is expected to pay off
+        expected_gain = pass_scheduler.expected_rescues(product['brand'], sites_missing)
+        if credit_budget.pass2_worth_it(expected_gain) and credit_budget.reserve():
+            job['pass2_credit_held'] = True
+            job['next'] = 'fetch_pass2'
+        else:
+            print(f"  ⏭ Pass 2 skipped (credit budget: expected gain {expected_gain:.2f} site(s))")
+            pass_scheduler.record_pass2(skipped=True)
+    elif sites_missing:
+        job['next'] = 'fetch_pass2'
+
+def fetch_pass2(job):
+    """Network step - Pass 2 image + brand query (or collect the speculative call)"""
+    product = job['product']
+    brand_for_query = job['brand_for_query']
+    print(f"  🔄 Pass 2: Brand-only query (local filtering enabled)")
+    
+    # NEW APPROACH: Use ONLY brand in query
+    # Let Google return ALL brand products, we filter locally
+    print(f"  Query: {brand_for_query} (filtering: {product['category']}, {product['gender']}, price ±{PRICE_TOLERANCE:.0%})")
+    
+    if job['pass2_future']:
+        search_results, pass2_seconds = job['pass2_future'].result()
+        # Sequential would have cost pass1 + pass2; speculation overlapped them
+        pass_scheduler.record_pass2(sent=True, speculated=True, saved_seconds=min(job['pass1_seconds'], pass2_seconds))
+    else:
+        try:
+            search_results, pass2_seconds = timed_call(lens_lookup, job, "2")
+        finally:
+            if job.pop('pass2_credit_held', False):
+                credit_budget.release()
+        pass_scheduler.record_pass2(sent=True)
+    
+    job['search_results'] = search_results
+    job['next'] = 'filter_pass2'
+
+def filter_pass2(job):
+    """CPU step - filter Pass 2 matches for the sites Pass 1 missed"""
+    product = job['product']
+    sites_missing = job['sites_missing']
+    site_results = job['site_results']
+    search_results = job.pop('search_results')
+    job['next'] = 'done'
+    
+    if search_results is None:
+        print("  ❌ Pass 2 API failure")
+        job['status'] = "pass2_api_error"
+        return
     
-    if sites_missing:
-        print(f"  🔄 Pass 2: Brand-only query (local filtering enabled)")
-        
-        # NEW APPROACH: Use ONLY brand in query
-        # Let Google return ALL brand products, we filter locally
-        # For sassafras sub-brands, use just "SASSAFRAS"
-        brand_for_query = product['brand']
-        if any(x in product['brand'].lower() for x in ['mascln', 'shae', 'pink paprika']):
-            brand_for_query = "SASSAFRAS"
-        
-        print(f"  Query: {brand_for_query} (filtering: {product['category']}, {product['gender']}, price ±30%)")
-        
-        search_results = search_image_with_query_on_serpapi(product['image'], brand_for_query)
-        
-        if search_results:
-            visual_matches = search_results.get("visual_matches", [])
-            print(f"  → Got {len(visual_matches)} results from Google, filtering locally...")
-            
-            site_results_pass2, _, _ = extract_product_info(
-                visual_matches,
-                product['brand'],
-                sites_missing,
-                product,  # Pass full product dict for local filtering
-                pass_type="second"
-            )
-            
-            # Update results
-            for site_key in sites_missing:
-                if site_results_pass2.get(site_key, {}).get('url') != "Not Found":
-                    site_results[site_key] = site_results_pass2[site_key]
+    visual_matches = search_results.get("visual_matches", [])
+    print(f"  → Got {len(visual_matches)} results from Google, filtering locally...")
+    if visual_matches:
+        job['status'] = "ok"
+    
+    site_results_pass2, _, _ = extract_product_info(
+        visual_matches,
+        product['brand'],
+        sites_missing,
+        product,  # Pass full product dict for local filtering
+        pass_type="second"
+    )
     
-    sites_found_final = sum(1 for site_data in site_results.values() if site_data["url"] != "Not Found")
-    print(f"  ✅ Total: Found on {sites_found_final}/{len(allowed_sites)} site(s)")
+    # Update results
+    job['pass2_searched'] = sites_missing
+    for site_key in sites_missing:
+        if site_results_pass2.get(site_key, NOT_FOUND).found:
+            site_results[site_key] = site_results_pass2[site_key]
+            job['pass2_found'].append(site_key)
+
+def finish_product(job):
+    """Record pass statistics, print the total and build the result entry"""
+    product = job['product']
+    result_entry = {
+        'product': product,
+        'site_results': job['site_results'],
+        'brand_site': job['brand_site'],
+        'status': job['status'],
+    }
+    metrics.inc("products_total", status=job['status'])
+    if job['status'] in ('no_image', 'api_error', 'budget_exhausted'):
+        return result_entry
+    
+    allowed_sites = job['allowed_sites']
+    pass_scheduler.record(product['brand'], allowed_sites, job['pass1_found'], job['pass2_searched'], job['pass2_found'])
+    credit_budget.record_found("1", len(job['pass1_found']))
+    if job['pass2_searched'] is not None:
+        credit_budget.record_found("2", len(job['pass2_found']))
     
-    return {'product': product, 'site_results': site_results, 'brand_site': brand_site}
+    # Pass hit rates per site: lookups vs. sites found
+    for site_key in allowed_sites:
+        metrics.inc("pass_site_lookups_total", **{"pass": "1", "site": site_key})
+        if site_key in job['pass1_found']:
+            metrics.inc("pass_site_hits_total", **{"pass": "1", "site": site_key})
+    for site_key in job['pass2_searched'] or []:
+        metrics.inc("pass_site_lookups_total", **{"pass": "2", "site": site_key})
+        if site_key in job['pass2_found']:
+            metrics.inc("pass_site_hits_total", **{"pass": "2", "site": site_key})
+    
+    sites_found_final = sum(1 for site_result in job['site_results'].values() if site_result.found)
+    print(f"  ✅ Total: Found on {sites_found_final}/{len(allowed_sites)} site(s)")
+    return result_entry
+
+PRODUCT_STEPS = {
+    'fetch_pass1': fetch_pass1,
+    'filter_pass1': filter_pass1,
+    'fetch_pass2': fetch_pass2,
+    'filter_pass2': filter_pass2,
+}
 
-def process_products(input_csv, output_csv):
+def process_single_product(product, product_idx, total_products):
     """
-    MULTI-BRAND PROCESSING with GENERIC OUTPUT SCHEMA
-    - Handles multiple brands in a single CSV
-    - Outputs generic columns: brand_price, brand_url (instead of brand-specific names)
-    - Maintains myntra and slikk columns as-is
+    Process a single product with 2-pass search strategy
+    Returns: dict with site_results and status
+    status: "ok", "no_image", "no_results" (Lens returned nothing),
+            "api_error" (Pass 1 failed) or "pass2_api_error" (Pass 2 failed)
     """
-    # Read input CSV
-    products = []
+    job = start_product(product, product_idx, total_products)
+    while job['next'] != 'done':
+        PRODUCT_STEPS[job['next']](job)
+    return finish_product(job)
+
+# Fixed output schema with generic brand columns
+OUTPUT_FIELDS = [
+    'style_id', 'brand', 'product_title', 'gender', 'category',
+    'klydo_price', 'myntra_price', 'slikk_price', 'brand_price',
+    'klydo_url', 'myntra_url', 'slikk_url', 'brand_url'
+]
+
+def read_products(input_csv):
+    """Yield products from the input CSV one row at a time"""
     with open(input_csv, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         for row in reader:
-            products.append({
+            yield {
                 'style_id': row.get('style_id', ''),
                 'brand': row.get('brand', ''),
                 'product_title': row.get('product_title', ''),
@@ -708,127 +1137,830 @@ def process_products(input_csv, output_csv):
                 'category': row.get('category', ''),
                 'min_price_rupees': row.get('min_price_rupees', ''),
                 'image': row.get('first_image_url', '')
-            })
+            }
+
+def scan_catalog(input_csv):
+    """
+    Streaming pre-pass over the input CSV
+    Returns: (product_count, {brand: count}) - memory grows with brands, not rows
+    """
+    total = 0
+    brand_counts = {}
+    for product in read_products(input_csv):
+        total += 1
+        brand_counts[product['brand']] = brand_counts.get(product['brand'], 0) + 1
+    return total, brand_counts
+
+def build_output_row(result_entry):
+    """Flatten one process_single_product result into the output CSV schema"""
+    product = result_entry['product']
+    site_results = result_entry['site_results']
+    brand_site = result_entry['brand_site']
+    
+    # Extract prices and URLs (SiteResult nulls become the CSV's sentinel strings)
+    myntra_data = site_results.get('myntra', NOT_FOUND)
+    slikk_data = site_results.get('slikk', NOT_FOUND)
     
-    # Get unique brands
-    unique_brands = list(set(p['brand'] for p in products))
+    # Get brand site data (if exists)
+    if brand_site:
+        brand_data = site_results.get(brand_site, NOT_FOUND)
+    else:
+        brand_data = NOT_FOUND
+    
+    return {
+        'style_id': product['style_id'],
+        'brand': product['brand'],
+        'product_title': product['product_title'],
+        'gender': product['gender'],
+        'category': product['category'],
+        'klydo_price': product['min_price_rupees'],
+        'myntra_price': myntra_data.csv_price(),
+        'slikk_price': slikk_data.csv_price(),
+        'brand_price': brand_data.csv_price(),
+        'klydo_url': f"https://klydo.in/product/{product['style_id']}",
+        'myntra_url': myntra_data.csv_url(),
+        'slikk_url': slikk_data.csv_url(),
+        'brand_url': brand_data.csv_url()
+    }
+
+def build_columnar_row(result_entry, position=None):
+    """One result as a typed row for the columnar output - nulls instead of sentinel strings"""
+    product = result_entry['product']
+    site_results = result_entry['site_results']
+    brand_site = result_entry['brand_site']
+    myntra_data = site_results.get('myntra', NOT_FOUND)
+    slikk_data = site_results.get('slikk', NOT_FOUND)
+    brand_data = site_results.get(brand_site, NOT_FOUND) if brand_site else NOT_FOUND
+    return {
+        'style_id': product['style_id'],
+        'brand': product['brand'],
+        'product_title': product['product_title'],
+        'gender': product['gender'],
+        'category': product['category'],
+        'status': result_entry['status'],
+        'brand_site': brand_site,
+        'klydo_price': to_float(product['min_price_rupees']),
+        'myntra_price': to_float(myntra_data.price),
+        'slikk_price': to_float(slikk_data.price),
+        'brand_price': to_float(brand_data.price),
+        'klydo_url': f"https://klydo.in/product/{product['style_id']}",
+        'myntra_url': myntra_data.url,
+        'slikk_url': slikk_data.url,
+        'brand_url': brand_data.url,
+        'input_position': position,
+    }
+
+class CoverageCounter:
+    """Running coverage totals - the summary never needs the full result list"""
+    def __init__(self):
+        self.total = 0
+        self.myntra = 0
+        self.slikk = 0
+        self.brand = 0
+        self.statuses = {}
+    
+    def add(self, result_entry):
+        row = build_output_row(result_entry)
+        self.total += 1
+        self.myntra += row['myntra_url'] != "Not Found"
+        self.slikk += row['slikk_url'] != "Not Found"
+        self.brand += row['brand_url'] != "Not Found"
+        status = result_entry['status']
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+    
+    def print_summary(self):
+        for label, count in [("MYNTRA", self.myntra), ("SLIKK", self.slikk), ("BRAND SITES", self.brand)]:
+            pct = (count / self.total * 100) if self.total else 0
+            status = "✅" if pct >= 50 else "⚠️"
+            print(f"{status} {label}: {count}/{self.total} ({pct:.0f}%)")
+        
+        # API failures are reported apart from genuine "not found" results
+        api_failures = self.statuses.get('api_error', 0)
+        pass2_failures = self.statuses.get('pass2_api_error', 0)
+        empty_results = self.statuses.get('no_results', 0)
+        if api_failures or pass2_failures:
+            print(f"❌ API FAILURES: {api_failures} product(s) not searched, {pass2_failures} missing Pass 2")
+        if empty_results:
+            print(f"⚠️ NO LENS MATCHES: {empty_results} product(s)")
+
+# Results with these statuses are not journaled, so --resume retries them
+# (a budgeted run resumed with fresh credits picks up where the budget ran out)
+RETRY_ON_RESUME_STATUSES = {'api_error', 'pass2_api_error', 'budget_exhausted'}
+
+def load_matched_style_ids(previous_csv):
+    """style_ids found on at least one site in a previous output CSV"""
+    matched = set()
+    with open(previous_csv, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if any(row.get(column, "Not Found") != "Not Found" for column in ('myntra_url', 'slikk_url', 'brand_url')):
+                matched.add(row['style_id'])
+    return matched
+
+def priority_sort_key(priority, brand_order=(), matched_style_ids=frozenset()):
+    """
+    Sort key for (position, product) - priority is a list of "price", "brand", "unmatched"
+    Ties keep the input order
+    """
+    brand_rank = {brand.lower(): i for i, brand in enumerate(brand_order)}
+    
+    def key(item):
+        position, product = item
+        parts = []
+        for name in priority:
+            if name == 'price':
+                try:
+                    parts.append(-float(product['min_price_rupees']))
+                except ValueError:
+                    parts.append(0.0)
+            elif name == 'brand':
+                parts.append(brand_rank.get(product['brand'].lower(), len(brand_rank)))
+            elif name == 'unmatched':
+                parts.append(product['style_id'] in matched_style_ids)
+            else:
+                raise ValueError(f"unknown priority: {name}")
+        parts.append(position)
+        return parts
+    return key
+
+def reorder_output(output_csv, positions):
+    """Rewrite output_csv with its rows in input order (positions: input position of each written row)"""
+    with open(output_csv, 'r', encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    tmp_path = f"{output_csv}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
+        writer.writeheader()
+        for _, row in sorted(zip(positions, rows), key=lambda pair: pair[0]):
+            writer.writerow(row)
+    os.replace(tmp_path, output_csv)
+
+def print_hedging_report(hedging, max_fraction):
+    """Duplicates sent, what they cost and the request latency percentiles without → with hedging"""
+    requests_total = hedging['requests']
+    share = hedging['hedges'] / requests_total if requests_total else 0
+    print(f"🪁 HEDGING: {hedging['hedges']} duplicate(s) for {requests_total} request(s) "
+          f"({share:.1%}, cap {max_fraction:.0%}), {hedging['hedge_wins']} answered first | "
+          f"+{hedging['extra_credits']} credit(s)")
+    changes = []
+    for quantile in ("p50", "p95", "p99"):
+        before, after = hedging['unhedged'][quantile], hedging['hedged'][quantile]
+        if before is None or after is None:
+            continue
+        change = f" ({(after - before) / before:+.0%})" if before else ""
+        changes.append(f"{quantile} {before:.2f}s → {after:.2f}s{change}")
+    if changes:
+        print(f"   Request latency without → with hedging: {', '.join(changes)}")
+
+def progress_line(done, total, elapsed):
+    """Run status: throughput, SerpAPI concurrency and circuit breaker state"""
+    flow = f"breaker {breaker.state.replace('_', '-')}"
+    if transport.concurrency:
+        flow = (f"concurrency {int(transport.concurrency.limit)} "
+                f"({transport.concurrency.in_flight} in flight) | {flow}")
+    return f"\n📊 {done}/{total} products | {done / elapsed if elapsed else 0:.2f}/s | {flow}\n"
+
+def process_products(input_csv, output_csv, workers=MAX_WORKERS, resume=False, journal_path=None,
+                     filter_workers=FILTER_WORKERS, max_in_flight=MAX_IN_FLIGHT,
+                     metrics_path=METRICS_PATH, metrics_interval=METRICS_INTERVAL, quiet=QUIET,
+                     budget=CREDIT_BUDGET, priority=PRIORITY, priority_brands=PRIORITY_BRANDS,
+                     previous_csv=None, delta=False, max_age_hours=DELTA_MAX_AGE_HOURS,
+                     manifest_path=MANIFEST_PATH, columnar_path=COLUMNAR_PATH,
+                     image_dedupe=IMAGE_DEDUPE, image_hash_distance=IMAGE_HASH_DISTANCE,
+                     record_path=RECORD_PATH, adaptive_concurrency=ADAPTIVE_CONCURRENCY,
+                     hedge=HEDGE_REQUESTS, hedge_percentile=HEDGE_PERCENTILE, hedge_max_percent=HEDGE_MAX_PERCENT):
+    """
+    MULTI-BRAND PROCESSING with GENERIC OUTPUT SCHEMA
+    - Handles multiple brands in a single CSV
+    - Outputs generic columns: brand_price, brand_url (instead of brand-specific names)
+    - Maintains myntra and slikk columns as-is
+    - STAGED PIPELINE: read → fetch (workers) → filter (filter_workers) → write,
+      connected by bounded queues; at most max_in_flight products are in the
+      pipeline, so memory stays bounded whichever stage is the bottleneck
+    - Global rate limiter across all SerpAPI calls
+    - STREAMING: rows are read lazily and each output row is written + flushed
+      as soon as it is final, so memory stays flat and a crash keeps finished rows
+    - CHECKPOINTS: every finished product is appended to a journal
+      (default: <output_csv>.journal); resume=True skips journaled products
+      and rebuilds the output from the journal plus the new work
+    - METRICS: latency, filter rejections, pass hit rates and throughput are
+      written to metrics_path at the end (and every metrics_interval seconds);
+      quiet=True drops the per-product console output
+    - CREDIT BUDGET: at most budget SerpAPI credits; products are searched in
+      priority order (see PRIORITY), Pass 2 credits go where the expected gain
+      is highest, and products past the budget are written as not searched.
+      The output CSV stays in input order.
+    - DELTA: every searched row's content hash and result go to the manifest;
+      delta=True carries results forward for rows that are unchanged and
+      younger than max_age_hours, and searches only the rest
+    - COLUMNAR: columnar_path also gets a typed Parquet/Arrow copy of the
+      output (nulls instead of sentinels; in search order on priority runs -
+      sort by input_position)
+    - IMAGE DEDUPE: image_dedupe=True hashes every image first; near-identical
+      images (within image_hash_distance bits) share one Lens lookup, and each
+      product filters the shared matches against its own attributes
+    - RECORD: record_path archives every Lens response of the run for
+      replay_catalog (appended - a resumed run adds to the same archive)
+    - FLOW CONTROL: with adaptive_concurrency the SerpAPI requests in flight
+      follow an AIMD limit up to workers; the circuit breaker pauses the run
+      while most requests fail
+    - HEDGING: hedge=True sends one duplicate of a request still running after
+      the hedge_percentile latency, capped at hedge_max_percent of requests
+      (off when a credit budget is set - duplicates cost credits)
+    """
+    global record_archive
+    # Check the arguments before anything is opened - a bad combination must not truncate the journal
+    if delta and not manifest_path:
+        raise ValueError("delta mode needs a manifest (manifest_path)")
+    unknown_priority = set(priority) - PRIORITY_KEYS
+    if unknown_priority:
+        raise ValueError(f"unknown priority: {', '.join(sorted(unknown_priority))}")
+    if min(workers, filter_workers, max_in_flight) < 1:
+        raise ValueError("workers, filter_workers and max_in_flight must be at least 1")
+    if hedge and not 0 < hedge_percentile < 1:
+        raise ValueError("hedge_percentile must be between 0 and 1")
+    journal_path = journal_path or f"{output_csv}.journal"
+    # Streaming pre-pass for the brand breakdown (input is re-read lazily below)
+    total_products, brand_counts = scan_catalog(input_csv)
     
     print(f"\n{'='*80}")
     print(f"🔍 MULTI-BRAND PRODUCT SEARCH v6.0 - LOCAL FILTERING")
     print(f"{'='*80}")
     print(f"Input: {input_csv} → Output: {output_csv}")
     print(f"✅ NEW: Brand-only queries + Local filtering")
-    print(f"✅ Filters: Rank≤15, Category match, Price±30%")
-    print(f"✅ Timeout: 60s (avoid API timeouts)")
+    print(f"✅ Filters: Rank≤{RANK_CUTOFF}, Category match, Price±{PRICE_TOLERANCE:.0%}")
+    print(f"✅ Timeout: {HTTP_READ_TIMEOUT}s/attempt, {HTTP_CALL_BUDGET}s/call, {HTTP_MAX_RETRIES} retries")
+    print(f"✅ Pipeline: {workers} fetch / {filter_workers} filter / 1 write worker(s), "
+          f"≤{max_in_flight} in flight | Rate limit: {REQUESTS_PER_SECOND:g} req/s")
+    transport.concurrency = concurrency if adaptive_concurrency else None
+    if transport.concurrency:
+        transport.concurrency.set_max(workers)
+        print(f"✅ Concurrency: adaptive (AIMD), {int(transport.concurrency.limit)} → ≤{workers} SerpAPI requests in flight")
+    print(f"✅ Circuit breaker: pause {BREAKER_PAUSE_SECONDS:g}s once {BREAKER_FAILURE_RATE:.0%} of the last "
+          f"{BREAKER_WINDOW} requests fail")
+    transport.hedger = hedger if hedge and budget is None else None
+    if transport.hedger:
+        hedger.hedge_percentile = hedge_percentile
+        hedger.max_fraction = hedge_max_percent / 100
+        print(f"✅ Hedging: duplicate requests slower than p{hedge_percentile * 100:g}, "
+              f"≤{hedge_max_percent:g}% extra requests")
+    elif hedge:
+        print(f"⚠️ Hedging off: duplicates would spend credits outside the budget")
+    if CACHE_ENABLED:
+        cache_mode = "force fresh" if FORCE_FRESH else f"TTL {CACHE_TTL_SECONDS // 3600}h"
+        print(f"✅ Response cache: {CACHE_PATH} ({cache_mode}, max {CACHE_MAX_ENTRIES} entries)")
     print(f"✅ Generic output schema: brand_price, brand_url")
+    print(f"✅ Journal: {journal_path}{' (resuming)' if resume else ''}")
+    if budget is not None or priority:
+        order = ", ".join(priority) if priority else "input order"
+        print(f"✅ Credit budget: {budget if budget is not None else 'no cap'} | Priority: {order}")
+    if columnar_path:
+        print(f"✅ Columnar output: {columnar_path}")
+    if record_path:
+        print(f"✅ Recording Lens responses: {record_path}")
+    if manifest_path:
+        delta_note = f" (delta: re-search new/changed rows and results older than {max_age_hours:g}h)" if delta else ""
+        print(f"✅ Manifest: {manifest_path}{delta_note}")
+    if metrics_path:
+        interval_note = f", every {metrics_interval:g}s" if metrics_interval else ""
+        print(f"✅ Metrics: {metrics_path}{interval_note}{' | quiet' if quiet else ''}")
     print(f"{'='*80}")
-    print(f"\n📦 Processing {len(products)} products from {len(unique_brands)} brand(s):")
-    for brand in sorted(unique_brands):
-        count = sum(1 for p in products if p['brand'] == brand)
-        print(f"   • {brand}: {count} product(s)")
+    print(f"\n📦 Processing {total_products} products from {len(brand_counts)} brand(s):")
+    for brand in sorted(brand_counts):
+        print(f"   • {brand}: {brand_counts[brand]} product(s)")
     print()
     
-    # Fixed output schema with generic brand columns
-    fieldnames = [
-        'style_id', 'brand', 'product_title', 'gender', 'category',
-        'klydo_price', 'myntra_price', 'slikk_price', 'brand_price',
-        'klydo_url', 'myntra_url', 'slikk_url', 'brand_url'
-    ]
-    
-    all_results = []
-    
     print(f"{'='*80}")
     print("PROCESSING PRODUCTS")
     print(f"{'='*80}")
     
-    # Process each product individually
-    for idx, product in enumerate(products, 1):
-        result = process_single_product(product, idx, len(products))
-        all_results.append(result)
-        
-        # Rate limiting between products
-        if idx < len(products):
-            time.sleep(1)
-    
-    # WRITE RESULTS
-    print(f"\n{'='*80}")
-    print("WRITING RESULTS")
-    print(f"{'='*80}\n")
-    
-    with open(output_csv, 'w', encoding='utf-8', newline='') as csv_file:
-        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+    credit_budget.limit = budget
+    credit_budget.products_total = total_products
+    matched_style_ids = load_matched_style_ids(previous_csv) if previous_csv and 'unmatched' in priority else set()
+    
+    coverage = CoverageCounter()
+    manifest = RunManifest(manifest_path) if manifest_path else None
+    columnar = ColumnarWriter(columnar_path) if columnar_path else None
+    record_archive = ResponseArchive(record_path) if record_path else None
+    journal = RunJournal(journal_path, resume=resume)  # last - opening it truncates the previous run's journal
+    max_age_seconds = max_age_hours * 3600 if max_age_hours is not None else None
+    delta_states = {}
+    
+    image_aliases.clear()
+    if image_dedupe:
+        # Only images that will actually be searched (not journaled / carried forward)
+        image_urls = [
+            product['image'] for product in read_products(input_csv)
+            if product['image'] and not journal.get(product['style_id'])
+            and not (delta and manifest.lookup(product, max_age_seconds)[0] == "unchanged")
+        ]
+        image_aliases.update(build_image_aliases(image_urls, image_hash_distance))
+    resumed = 0
+    if resume:
+        print(f"\n⏭ Resuming: {len(journal.completed)} product(s) already in journal")
+    
+    # Each product carries its own log buffer between stages; the writer prints
+    # it with the row, so console output stays grouped and in input order
+    pipeline = Pipeline(max_in_flight)
+    
+    run_started = time.monotonic()
+    
+    def update_gauges():
+        elapsed = max(time.monotonic() - run_started, 1e-9)
+        metrics.set_gauge("products_done", coverage.total)
+        metrics.set_gauge("products_per_second", round(coverage.total / elapsed, 3))
+        if transport.concurrency:
+            metrics.set_gauge("serpapi_concurrency_limit", int(transport.concurrency.limit))
+            metrics.set_gauge("serpapi_in_flight", transport.concurrency.in_flight)
+        metrics.set_gauge("circuit_breaker_open", int(breaker.state != "closed"))
+        if transport.hedger:
+            hedging = transport.hedger.report()
+            metrics.set_gauge("serpapi_hedged_requests", hedging['hedges'])
+            metrics.set_gauge("serpapi_hedge_wins", hedging['hedge_wins'])
+            metrics.set_gauge("serpapi_hedge_extra_credits", hedging['extra_credits'])
+            for mode in ("hedged", "unhedged"):
+                for quantile, value in hedging[mode].items():
+                    if value is not None:
+                        metrics.set_gauge("serpapi_request_latency_seconds", round(value, 3),
+                                          quantile=quantile, mode=mode)
+        for pass_label in ("1", "2"):
+            lookups = metrics.counter_total("pass_site_lookups_total", **{"pass": pass_label})
+            hits = metrics.counter_total("pass_site_hits_total", **{"pass": pass_label})
+            metrics.set_gauge("pass_hit_rate", round(hits / lookups, 4) if lookups else 0.0, **{"pass": pass_label})
+    
+    exporter = None
+    if metrics_path:
+        exporter = PeriodicExporter(metrics, metrics_path, metrics_interval, before_export=update_gauges).start()
+    
+    with grouped_console() as console, open(output_csv, 'w', encoding='utf-8', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=OUTPUT_FIELDS)
         writer.writeheader()
         
-        for result_entry in all_results:
-            product = result_entry['product']
-            site_results = result_entry['site_results']
-            brand_site = result_entry['brand_site']
-            
-            # Extract prices and URLs
-            myntra_data = site_results.get('myntra', {"url": "Not Found", "price": "Product not available on site"})
-            slikk_data = site_results.get('slikk', {"url": "Not Found", "price": "Product not available on site"})
-            
-            # Get brand site data (if exists)
-            if brand_site:
-                brand_data = site_results.get(brand_site, {"url": "Not Found", "price": "Product not available on site"})
-            else:
-                brand_data = {"url": "Not Found", "price": "Product not available on site"}
-            
-            row_data = {
-                'style_id': product['style_id'],
-                'brand': product['brand'],
-                'product_title': product['product_title'],
-                'gender': product['gender'],
-                'category': product['category'],
-                'klydo_price': product['min_price_rupees'],
-                'myntra_price': myntra_data['price'],
-                'slikk_price': slikk_data['price'],
-                'brand_price': brand_data['price'],
-                'klydo_url': f"https://klydo.in/product/{product['style_id']}",
-                'myntra_url': myntra_data['url'],
-                'slikk_url': slikk_data['url'],
-                'brand_url': brand_data['url']
-            }
-            
-            writer.writerow(row_data)
-    
+        def read_stage():
+            products = enumerate(read_products(input_csv))
+            if priority:
+                # Budgeted runs need the whole catalog to order it
+                products = sorted(products, key=priority_sort_key(priority, priority_brands, matched_style_ids))
+            for idx, (position, product) in enumerate(products, 1):
+                journaled = journal.get(product['style_id'])
+                if journaled:
+                    yield {
+                        'idx': idx,
+                        'position': position,
+                        'log': io.StringIO(),
+                        'resumed': True,
+                        'result': {
+                            'product': product,
+                            'site_results': site_results_from_json(journaled['site_results']),
+                            'brand_site': journaled['brand_site'],
+                            'status': journaled['status'],
+                        },
+                    }
+                    continue
+                if delta:
+                    state, stored = manifest.lookup(product, max_age_seconds)
+                    delta_states[state] = delta_states.get(state, 0) + 1
+                    if stored:
+                        yield {
+                            'idx': idx,
+                            'position': position,
+                            'log': io.StringIO(),
+                            'carried': True,
+                            'result': {
+                                'product': product,
+                                **stored,
+                                'site_results': site_results_from_json(stored['site_results']),
+                            },
+                        }
+                        continue
+                log = io.StringIO()
+                with console.redirect(log):
+                    job = start_product(product, idx, total_products)
+                    if job['next'] == 'done':
+                        job['result'] = finish_product(job)
+                job['log'] = log
+                job['position'] = position
+                yield job
+        
+        def fetch_stage(job):
+            with console.redirect(job['log']):
+                PRODUCT_STEPS[job['next']](job)
+            pipeline.send('filter', job)
+        
+        def filter_stage(job):
+            with console.redirect(job['log']):
+                PRODUCT_STEPS[job['next']](job)
+                if job['next'] == 'done':
+                    job['result'] = finish_product(job)
+            pipeline.send('write' if job['next'] == 'done' else 'fetch', job)
+        
+        # Writer - journals each product as it finishes, writes rows in input order
+        pending = {}
+        next_idx = 1
+        positions = [] if priority else None   # input position of each written row - only a priority run is reordered
+        
+        def write_stage(job):
+            nonlocal resumed, next_idx
+            result_entry = job['result']
+            if not job.get('resumed') and result_entry['status'] not in RETRY_ON_RESUME_STATUSES:
+                journal.record(result_entry)
+                if manifest and not job.get('carried'):
+                    manifest.record(result_entry)
+            pending[job['idx']] = job
+            while next_idx in pending:
+                ready = pending.pop(next_idx)
+                writer.writerow(build_output_row(ready['result']))
+                csv_file.flush()
+                if positions is not None:
+                    positions.append(ready['position'])
+                if columnar:
+                    columnar.write(build_columnar_row(ready['result'], ready['position']))
+                coverage.add(ready['result'])
+                resumed += ready.get('resumed', False)
+                if not quiet:
+                    console.emit(ready['log'].getvalue())
+                if PROGRESS_EVERY and coverage.total % PROGRESS_EVERY == 0:
+                    console.emit(progress_line(coverage.total, total_products, time.monotonic() - run_started))
+                next_idx += 1
+                pipeline.complete(ready)
+        
+        pipeline.add_stage('fetch', workers, fetch_stage)
+        pipeline.add_stage('filter', filter_workers, filter_stage)
+        pipeline.add_stage('write', 1, write_stage)
+        
+        try:
+            pipeline.run(read_stage(), route=lambda job: 'write' if job.get('result') else 'fetch')
+        finally:
+            journal.close()
+            if manifest:
+                manifest.close()
+            if columnar:
+                columnar.close()
+            if record_archive:
+                record_archive.close()
+            if exporter:
+                exporter.stop()
+    
+    if priority:
+        reorder_output(output_csv, positions)
+    update_gauges()
     # Final coverage report
-    print(f"\n✅ Processed {len(products)} products")
+    carried = delta_states.get('unchanged', 0)
+    print(f"\n✅ Processed {coverage.total} products ({resumed} from journal, {carried} carried forward, "
+          f"{coverage.total - resumed - carried} searched)")
+    if delta:
+        print(f"🔁 DELTA: {carried} unchanged, {delta_states.get('new', 0)} new, {delta_states.get('changed', 0)} changed, "
+              f"{delta_states.get('stale', 0)} older than {max_age_hours:g}h")
     print(f"\n{'='*80}")
     print("COVERAGE SUMMARY")
     print(f"{'='*80}")
     
-    myntra_count = sum(1 for r in all_results if r['site_results'].get('myntra', {}).get('url') != "Not Found")
-    slikk_count = sum(1 for r in all_results if r['site_results'].get('slikk', {}).get('url') != "Not Found")
-    
-    # Count brand site coverage (each product may have different brand site)
-    brand_count = 0
-    for r in all_results:
-        brand_site = r['brand_site']
-        if brand_site and r['site_results'].get(brand_site, {}).get('url') != "Not Found":
-            brand_count += 1
+    coverage.print_summary()
+    
+    cache = get_response_cache()
+    if cache:
+        print(f"💾 CACHE: {cache.hits} hit(s), {cache.misses} miss(es)")
+    if lens_single_flight.shared_in_flight or lens_single_flight.shared_repeats:
+        print(f"🔗 COALESCED: {lens_single_flight.shared_in_flight} lookup(s) joined an in-flight call, "
+              f"{lens_single_flight.shared_repeats} repeat(s) reused")
+    if ADAPTIVE_PASSES:
+        pass_scheduler.print_report()
+    credit_budget.print_report()
+    if transport.concurrency:
+        print(f"🎛 CONCURRENCY: {transport.concurrency.describe()}")
+    print(f"🔌 CIRCUIT BREAKER: {breaker.describe()}")
+    if transport.hedger:
+        print_hedging_report(transport.hedger.report(), transport.hedger.max_fraction)
+    match_filters.print_report()
+    print(f"🎯 HIT RATE: Pass 1 {metrics.gauge('pass_hit_rate', **{'pass': '1'}):.0%} of site lookups, "
+          f"Pass 2 {metrics.gauge('pass_hit_rate', **{'pass': '2'}):.0%} | "
+          f"{metrics.gauge('products_per_second'):.2f} products/s")
+    if metrics_path:
+        print(f"📈 METRICS: {metrics_path}")
+    if record_archive:
+        print(f"📼 RECORDED: {record_archive.records} Lens response(s) → {record_path}")
+        record_archive = None
     
-    myntra_pct = (myntra_count / len(products) * 100) if products else 0
-    slikk_pct = (slikk_count / len(products) * 100) if products else 0
-    brand_pct = (brand_count / len(products) * 100) if products else 0
+    print(f"\n{'='*80}")
+    print("PIPELINE STAGES")
+    print(f"{'='*80}")
+    pipeline.print_report()
     
-    myntra_status = "✅" if myntra_pct >= 50 else "⚠️"
-    slikk_status = "✅" if slikk_pct >= 50 else "⚠️"
-    brand_status = "✅" if brand_pct >= 50 else "⚠️"
+    print(f"\n✅ Output saved: {output_csv}")
+    print("📄 Schema: style_id, brand, ..., myntra_price, slikk_price, brand_price, myntra_url, slikk_url, brand_url")
+
+# === SHARED WORK QUEUE ===
+# Split one catalog over any number of worker processes (or machines sharing the
+# queue file): --enqueue loads the CSV, each --work process leases products,
+# --merge writes the usual output CSV once the queue is drained.
+
+def result_record(result_entry):
+    """The JSON-serializable part of a result (the product itself is stored separately)"""
+    return {
+        'status': result_entry['status'],
+        'brand_site': result_entry['brand_site'],
+        'site_results': site_results_to_json(result_entry['site_results']),
+    }
+
+def enqueue_catalog(input_csv, queue_path):
+    """Load the input CSV into the work queue (products already queued are kept as they are)"""
+    queue = WorkQueue(queue_path, QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS)
+    added, duplicates, skipped = queue.enqueue(read_products(input_csv))
+    counts = queue.counts()
+    queue.close()
+    print(f"📥 Queued {added} product(s) from {input_csv} into {queue_path} ({skipped} already queued)")
+    if duplicates:
+        print(f"   ⚠️ {duplicates} row(s) repeat an earlier style_id - not searched again, "
+              f"merged with the first row's result")
+    print(f"   Queue: {', '.join(f'{n} {status}' for status, n in sorted(counts.items()))}")
+
+def run_queue_worker(queue_path, workers=MAX_WORKERS, quiet=QUIET, metrics_path=METRICS_PATH,
+                     adaptive_concurrency=ADAPTIVE_CONCURRENCY):
+    """
+    One worker process: lease products from the queue until it is drained
+    - workers threads each lease one product at a time and write the result back
+    - a heartbeat renews this process's leases; a crashed worker's products
+      are picked up by the others once QUEUE_LEASE_SECONDS pass
+    - the SerpAPI rate limit (REQUESTS_PER_SECOND) is shared by all worker
+      processes through the queue file
+    """
+    queue = WorkQueue(queue_path, QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS)
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    transport.rate_limiter = SharedRateLimiter(queue_path, REQUESTS_PER_SECOND)
+    transport.concurrency = concurrency if adaptive_concurrency else None
+    if transport.concurrency:
+        transport.concurrency.set_max(workers)
+    total_products = sum(queue.counts().values())
+    coverage = CoverageCounter()
+    coverage_lock = threading.Lock()
+    stop = threading.Event()
+    
+    print(f"👷 Worker {owner}: {workers} thread(s), queue {queue_path} "
+          f"(lease {QUEUE_LEASE_SECONDS}s, shared limit {REQUESTS_PER_SECOND:g} req/s)")
+    
+    def heartbeat():
+        while not stop.wait(QUEUE_LEASE_SECONDS / 3):
+            queue.renew(owner)
+    
+    def work(console):
+        while not stop.is_set():
+            leased = queue.lease(owner)
+            if not leased:
+                counts = queue.counts()
+                if not counts.get('queued') and not counts.get('leased'):
+                    return
+                stop.wait(QUEUE_POLL_SECONDS)  # others still busy - their leases may expire
+                continue
+            
+            style_id, position, product = leased[0]
+            log = io.StringIO()
+            with console.redirect(log):
+                result_entry = process_single_product(product, position, total_products)
+            status = queue.complete(style_id, result_record(result_entry),
+                                    retry=result_entry['status'] in RETRY_ON_RESUME_STATUSES)
+            if status == 'queued':
+                log.write(f"  🔁 Re-queued after {result_entry['status']}\n")
+            if not quiet:
+                console.emit(log.getvalue())
+            if status == 'done':
+                with coverage_lock:
+                    coverage.add(result_entry)
+    
+    started = time.monotonic()
+    heartbeat_thread = threading.Thread(target=heartbeat, name="queue-heartbeat", daemon=True)
+    heartbeat_thread.start()
+    try:
+        with grouped_console() as console, ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(work, console) for _ in range(workers)]:
+                future.result()
+    finally:
+        stop.set()
+        queue.release(owner)
+        queue.close()
+    
+    elapsed = time.monotonic() - started
+    print(f"\n✅ Worker {owner}: {coverage.total} product(s) in {elapsed:.1f}s "
+          f"({coverage.total / elapsed if elapsed else 0:.2f} products/s)")
+    coverage.print_summary()
+    if transport.concurrency:
+        print(f"🎛 CONCURRENCY: {transport.concurrency.describe()}")
+    print(f"🔌 CIRCUIT BREAKER: {breaker.describe()}")
+    if metrics_path:
+        metrics.set_gauge("products_done", coverage.total)
+        metrics.set_gauge("products_per_second", round(coverage.total / elapsed, 3) if elapsed else 0.0)
+        metrics.export(metrics_path)
+
+def merge_queue(queue_path, output_csv, columnar_path=COLUMNAR_PATH):
+    """Write the output CSV (usual schema, input order) from the queue's results"""
+    queue = WorkQueue(queue_path, QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS)
+    columnar = ColumnarWriter(columnar_path) if columnar_path else None
+    coverage = CoverageCounter()
+    unfinished = failed = 0
+    duplicates = queue.duplicate_count()
+    with open(output_csv, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
+        writer.writeheader()
+        for position, (product, record, status) in enumerate(queue.results()):
+            if status == 'failed':
+                failed += 1
+            elif status != 'done':
+                unfinished += 1
+            if record is None:
+                record = {'status': 'api_error' if status == 'failed' else 'not_processed',
+                          'brand_site': None, 'site_results': {}}
+            result_entry = {
+                'product': product,
+                **record,
+                'site_results': site_results_from_json(record['site_results']),
+            }
+            writer.writerow(build_output_row(result_entry))
+            if columnar:
+                columnar.write(build_columnar_row(result_entry, position))
+            coverage.add(result_entry)
+    queue.close()
+    if columnar:
+        columnar.close()
     
-    print(f"{myntra_status} MYNTRA: {myntra_count}/{len(products)} ({myntra_pct:.0f}%)")
-    print(f"{slikk_status} SLIKK: {slikk_count}/{len(products)} ({slikk_pct:.0f}%)")
-    print(f"{brand_status} BRAND SITES: {brand_count}/{len(products)} ({brand_pct:.0f}%)")
+    print(f"\n{'='*80}")
+    print(f"COVERAGE SUMMARY ({queue_path} → {output_csv})")
+    print(f"{'='*80}")
+    coverage.print_summary()
+    if duplicates:
+        print(f"🔁 DUPLICATES: {duplicates} row(s) repeat an earlier style_id and share its result")
+    if failed:
+        print(f"⛔ FAILED: {failed} product(s) leased {QUEUE_MAX_ATTEMPTS} times without finishing "
+              f"(worker crashed or hung) - written as API failures")
+    if unfinished:
+        print(f"⚠️ UNFINISHED: {unfinished} product(s) still queued/leased - written with their last result "
+              f"(or Not Found); merge again once the workers are done")
+    print(f"\n✅ Output saved: {output_csv}")
+
+# === RECORD / REPLAY ===
+# A run with --record ARCHIVE stores every Lens response it gets; --replay ARCHIVE
+# runs the same product steps (filters, Pass 1 → Pass 2) from the archive on all
+# cores without a single API call - e.g. to see the effect of new filter thresholds.
+
+def _init_replay_worker(archive_path):
+    global replay_archive
+    replay_archive = ArchiveReader(archive_path)
+
+def _replay_chunk(task):
+    """Replay process: run the product steps for one chunk of [(position, product)]"""
+    chunk, total_products, keep_logs = task
+    misses = replay_archive.misses
+    results = []
+    for position, product in chunk:
+        log = io.StringIO()
+        with redirect_stdout(log):
+            result_entry = process_single_product(product, position + 1, total_products)
+        results.append((result_entry, log.getvalue() if keep_logs else ""))
+    return results, replay_archive.misses - misses
+
+def replay_catalog(input_csv, output_csv, archive_path, processes=REPLAY_PROCESSES, quiet=QUIET,
+                   columnar_path=COLUMNAR_PATH):
+    """
+    Re-run the catalog from a recorded archive - no network calls
+    - the archive is memory-mapped by every replay process (pages are shared)
+    - chunks of REPLAY_CHUNK_SIZE products are spread over processes (default:
+      one per core); output rows stay in input order
+    - adaptive pass scheduling is off: Pass 2 runs wherever Pass 1 leaves a site
+      missing and the archive has a Pass 2 response for the product
+    """
+    reader = ArchiveReader(archive_path)
+    archived = len(reader)
+    reader.close()
+    products = list(enumerate(read_products(input_csv)))
+    processes = processes or os.cpu_count() or 1
+    chunks = [products[i:i + REPLAY_CHUNK_SIZE] for i in range(0, len(products), REPLAY_CHUNK_SIZE)]
+    print(f"📼 Replaying {len(products)} product(s) from {archive_path} ({archived} response(s)) "
+          f"on {processes} process(es)")
+    
+    columnar = ColumnarWriter(columnar_path) if columnar_path else None
+    coverage = CoverageCounter()
+    misses = 0
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_replay_worker,
+                             initargs=(archive_path,)) as executor, \
+            open(output_csv, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
+        writer.writeheader()
+        tasks = [(chunk, len(products), not quiet) for chunk in chunks]
+        for chunk, (results, chunk_misses) in zip(chunks, executor.map(_replay_chunk, tasks)):
+            misses += chunk_misses
+            for (position, _), (result_entry, log) in zip(chunk, results):
+                writer.writerow(build_output_row(result_entry))
+                if columnar:
+                    columnar.write(build_columnar_row(result_entry, position))
+                coverage.add(result_entry)
+                if log:
+                    print(log, end="")
+    if columnar:
+        columnar.close()
+    elapsed = time.monotonic() - started
     
+    print(f"\n{'='*80}")
+    print(f"COVERAGE SUMMARY (replay of {archive_path})")
+    print(f"{'='*80}")
+    coverage.print_summary()
+    if misses:
+        print(f"⚠️ NOT IN ARCHIVE: {misses} product(s) have no recorded Pass 1 response (written as api_error)")
+    print(f"⏱ REPLAY: {coverage.total} product(s) in {elapsed:.1f}s "
+          f"({coverage.total / elapsed if elapsed else 0:.0f} products/s, 0 API calls)")
     print(f"\n✅ Output saved: {output_csv}")
-    print("📄 Schema: style_id, brand, ..., myntra_price, slikk_price, brand_price, myntra_url, slikk_url, brand_url")
 
 # === MAIN EXECUTION ===
 if __name__ == "__main__":
-    INPUT_FILE = "sample.csv"
-    OUTPUT_FILE = "many.csv"
-    
-    process_products(INPUT_FILE, OUTPUT_FILE)
+    parser = argparse.ArgumentParser(description="Multi-brand product search (Google Lens + local filtering)")
+    parser.add_argument("input_file", nargs="?", default="sample.csv", help="input catalog CSV")
+    parser.add_argument("output_file", nargs="?", default="many.csv", help="output CSV")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="fetch workers (ceiling of the adaptive SerpAPI concurrency)")
+    parser.add_argument("--hedge", action="store_true", default=HEDGE_REQUESTS,
+                        help="send one duplicate of SerpAPI requests slower than --hedge-percentile (costs credits)")
+    parser.add_argument("--hedge-percentile", type=float, default=HEDGE_PERCENTILE,
+                        help="latency percentile (0-1) of recent requests after which a duplicate is sent")
+    parser.add_argument("--hedge-max-percent", type=float, default=HEDGE_MAX_PERCENT,
+                        help="cap on duplicates, in %% of all requests")
+    parser.add_argument("--fixed-concurrency", action="store_true",
+                        help="one SerpAPI request per fetch worker, no AIMD limit")
+    parser.add_argument("--filter-workers", type=int, default=FILTER_WORKERS, help="filter workers")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="products in the pipeline at once")
+    parser.add_argument("--resume", action="store_true", help="skip products already in the journal")
+    parser.add_argument("--journal", default=None, help="checkpoint journal path (default: <output>.journal)")
+    parser.add_argument("--metrics", default=METRICS_PATH,
+                        help="write run metrics here (.json, or .prom/.txt for Prometheus text format)")
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL,
+                        help="also export metrics every N seconds during the run (0 = end only)")
+    parser.add_argument("--quiet", action="store_true", default=QUIET, help="no per-product output, summary only")
+    parser.add_argument("--budget", type=int, default=CREDIT_BUDGET, help="SerpAPI credit cap for this run")
+    parser.add_argument("--priority", default=",".join(PRIORITY),
+                        help="product order, comma-separated: price, brand, unmatched (default: input order)")
+    parser.add_argument("--priority-brands", default=",".join(PRIORITY_BRANDS),
+                        help="brands searched first with --priority brand, comma-separated")
+    parser.add_argument("--previous", default=None,
+                        help="previous output CSV - its unmatched products go first with --priority unmatched")
+    parser.add_argument("--delta", action="store_true",
+                        help="only search rows that are new/changed since the manifest, or whose result is too old")
+    parser.add_argument("--max-age", type=float, default=DELTA_MAX_AGE_HOURS,
+                        help="hours after which a carried-forward result is searched again (--delta)")
+    parser.add_argument("--columnar", default=COLUMNAR_PATH,
+                        help="also write a typed .parquet / .arrow copy of the output (needs pyarrow)")
+    parser.add_argument("--dedupe-images", action="store_true", default=IMAGE_DEDUPE,
+                        help="perceptual-hash images first; near-identical images share one Lens lookup (needs Pillow)")
+    parser.add_argument("--hash-distance", type=int, default=IMAGE_HASH_DISTANCE,
+                        help="max differing hash bits (of 64) for --dedupe-images")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="manifest of last results per row")
+    parser.add_argument("--exact-filter-stats", action="store_true", default=EXACT_FILTER_STATS,
+                        help="debug: check every top-ranked match, even after each site has its candidate, "
+                             "so filter rejection counts are exact")
+    parser.add_argument("--force-fresh", action="store_true", default=FORCE_FRESH,
+                        help=f"ignore cached Lens responses in {CACHE_PATH} (fresh results are still cached)")
+    parser.add_argument("--record", default=RECORD_PATH, help="archive every Lens response of this run here")
+    parser.add_argument("--replay", default=None,
+                        help="re-run input_file from a --record archive offline (no API calls)")
+    parser.add_argument("--processes", type=int, default=REPLAY_PROCESSES,
+                        help="replay processes (default: one per CPU core)")
+    parser.add_argument("--queue", default=None, help="shared work queue file (SQLite) for multi-process runs")
+    queue_mode = parser.add_mutually_exclusive_group()
+    queue_mode.add_argument("--enqueue", action="store_true", help="load input_file into the queue")
+    queue_mode.add_argument("--work", action="store_true", help="process products from the queue until it is drained")
+    queue_mode.add_argument("--merge", action="store_true", help="write output_file from the queue's results")
+    args = parser.parse_args()
+    unknown_priority = set(filter(None, args.priority.split(","))) - PRIORITY_KEYS
+    if unknown_priority:
+        parser.error(f"unknown --priority: {', '.join(sorted(unknown_priority))}")
+    
+    FORCE_FRESH = args.force_fresh
+    EXACT_FILTER_STATS = args.exact_filter_stats
+    
+    if args.enqueue or args.work or args.merge:
+        if not args.queue:
+            parser.error("--enqueue/--work/--merge need --queue PATH")
+        if args.enqueue:
+            enqueue_catalog(args.input_file, args.queue)
+        elif args.work:
+            run_queue_worker(args.queue, workers=args.workers, quiet=args.quiet, metrics_path=args.metrics,
+                             adaptive_concurrency=not args.fixed_concurrency)
+        else:
+            merge_queue(args.queue, args.output_file, columnar_path=args.columnar)
+        sys.exit(0)
+    
+    if args.replay:
+        replay_catalog(args.input_file, args.output_file, args.replay, processes=args.processes,
+                       quiet=args.quiet, columnar_path=args.columnar)
+        sys.exit(0)
+    
+    process_products(args.input_file, args.output_file, workers=args.workers,
+                     resume=args.resume, journal_path=args.journal,
+                     filter_workers=args.filter_workers, max_in_flight=args.max_in_flight,
+                     metrics_path=args.metrics, metrics_interval=args.metrics_interval, quiet=args.quiet,
+                     budget=args.budget, priority=[p for p in args.priority.split(",") if p],
+                     priority_brands=[b.strip() for b in args.priority_brands.split(",") if b.strip()],
+                     previous_csv=args.previous, delta=args.delta, max_age_hours=args.max_age,
+                     manifest_path=args.manifest, columnar_path=args.columnar,
+                     image_dedupe=args.dedupe_images, image_hash_distance=args.hash_distance,
+                     record_path=args.record, adaptive_concurrency=not args.fixed_concurrency,
+                     hedge=args.hedge, hedge_percentile=args.hedge_percentile,
+                     hedge_max_percent=args.hedge_max_percent)
     
     print("\n✅ ALL DONE!")
-    print(f"📄 Check: {OUTPUT_FILE}")
+    print(f"📄 Check: {args.output_file}")
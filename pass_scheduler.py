@@ -0,0 +1,110 @@
+import threading
+
+
+class PassScheduler:
+    """
+    Adaptive Pass 1 / Pass 2 scheduling from hit rates observed during the run
+    - Tracks, per (brand, site): how often Pass 1 finds the site, and how often
+      Pass 2 rescues it when Pass 1 missed
+    - plan(): "speculate" (send Pass 2 together with Pass 1) when Pass 1 is
+      likely to miss at least one site, else "sequential"
+    - should_run_pass2(): False when Pass 2 has kept failing to rescue the
+      missing sites; every probe_every-th skip still runs it so rates stay fresh
+    Rates are smoothed with a uniform prior and need min_samples before acting.
+    """
+    def __init__(self, speculate_miss_probability=0.6, skip_rescue_rate=0.1, min_samples=5, probe_every=10):
+        self.speculate_miss_probability = speculate_miss_probability
+        self.skip_rescue_rate = skip_rescue_rate
+        self.min_samples = min_samples
+        self.probe_every = probe_every
+        self._lock = threading.Lock()
+        self._pass1 = {}   # (brand, site) -> [attempts, hits]
+        self._pass2 = {}   # (brand, site) -> [attempts, rescues]
+        self._skips = {}   # brand -> consecutive skips
+
+        # Run report
+        self.speculated = 0
+        self.speculation_wasted = 0
+        self.pass2_sent = 0
+        self.pass2_skipped = 0
+        self.latency_saved = 0.0
+
+    @staticmethod
+    def _rate(counts):
+        attempts, hits = counts
+        return (hits + 1) / (attempts + 2)
+
+    def miss_probability(self, brand, sites):
+        """Predicted chance Pass 1 misses at least one site (None until enough samples)"""
+        with self._lock:
+            p_all_hit = 1.0
+            for site in sites:
+                counts = self._pass1.get((brand, site), [0, 0])
+                if counts[0] < self.min_samples:
+                    return None
+                p_all_hit *= self._rate(counts)
+        return 1.0 - p_all_hit
+
+    def _pass2_useless(self, brand, sites):
+        """True when Pass 2 has reliably failed to rescue every one of these sites"""
+        for site in sites:
+            counts = self._pass2.get((brand, site), [0, 0])
+            if counts[0] < self.min_samples or self._rate(counts) > self.skip_rescue_rate:
+                return False
+        return True
+
+    def plan(self, brand, sites):
+        miss = self.miss_probability(brand, sites)
+        if miss is None or miss < self.speculate_miss_probability:
+            return "sequential"
+        with self._lock:
+            # Only the sites Pass 1 tends to miss matter for Pass 2
+            likely_missing = [s for s in sites if self._rate(self._pass1.get((brand, s), [0, 0])) < 0.5]
+            if likely_missing and self._pass2_useless(brand, likely_missing):
+                return "sequential"
+        return "speculate"
+
+    def expected_rescues(self, brand, sites):
+        """Expected number of these sites Pass 2 would find (smoothed per-site rescue rates)"""
+        with self._lock:
+            return sum(self._rate(self._pass2.get((brand, site), [0, 0])) for site in sites)
+
+    def should_run_pass2(self, brand, missing_sites):
+        with self._lock:
+            if not self._pass2_useless(brand, missing_sites):
+                return True
+            skips = self._skips.get(brand, 0) + 1
+            self._skips[brand] = skips
+            return skips % self.probe_every == 0
+
+    def record(self, brand, sites, pass1_found, pass2_missing=None, pass2_found=()):
+        """
+        Record one product's outcome
+        pass1_found: sites Pass 1 found; pass2_missing: sites Pass 2 searched
+        (None when Pass 2 did not run); pass2_found: sites Pass 2 rescued
+        """
+        with self._lock:
+            for site in sites:
+                counts = self._pass1.setdefault((brand, site), [0, 0])
+                counts[0] += 1
+                counts[1] += site in pass1_found
+            if pass2_missing is not None:
+                self._skips[brand] = 0
+                for site in pass2_missing:
+                    counts = self._pass2.setdefault((brand, site), [0, 0])
+                    counts[0] += 1
+                    counts[1] += site in pass2_found
+
+    def record_pass2(self, sent=False, skipped=False, speculated=False, wasted=False, saved_seconds=0.0):
+        with self._lock:
+            self.pass2_sent += sent
+            self.pass2_skipped += skipped
+            self.speculated += speculated
+            self.speculation_wasted += wasted
+            self.latency_saved += saved_seconds
+
+    def print_report(self):
+        print(f"🧠 PASS SCHEDULER: Pass 2 sent {self.pass2_sent} "
+              f"({self.speculated} speculative, {self.speculation_wasted} unneeded credit(s)), "
+              f"skipped {self.pass2_skipped} (credit(s) saved)")
+        print(f"   Latency saved by speculation: {self.latency_saved:.1f}s")
@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class Stage:
+    """
+    One pipeline stage - a bounded input queue served by `workers` threads
+    Keeps its own throughput / queue-depth statistics
+    """
+    def __init__(self, name, workers, handler, maxsize):
+        self.name = name
+        self.workers = workers
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.max_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        self.queue.put(item)
+        depth = self.queue.qsize()
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+            self._depth_samples += 1
+
+    @property
+    def avg_depth(self):
+        return self._depth_total / self._depth_samples if self._depth_samples else 0.0
+
+
+class Pipeline:
+    """
+    Staged pipeline (e.g. read → fetch → filter → write) with bounded queues
+    - The source is read on the calling thread; each stage runs its own workers
+    - At most max_in_flight items exist between the source and complete(),
+      so the reader blocks (backpressure) whichever stage is the bottleneck
+    - Handlers move items on with send(stage_name, item) and call complete(item)
+      when an item leaves the pipeline; items may revisit earlier stages
+    Every queue can hold all in-flight items, so a put never blocks a worker.
+    """
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self.stages = {}
+        self._slots = threading.Semaphore(max_in_flight)
+        self._in_flight = 0
+        self._idle = threading.Condition()
+        self._error = None
+        self._threads = []
+        self.read = 0
+        self.elapsed = 0.0
+
+    def add_stage(self, name, workers, handler):
+        # Room for every in-flight item plus one stop marker per worker
+        self.stages[name] = Stage(name, workers, handler, maxsize=self.max_in_flight + workers)
+
+    def send(self, stage_name, item):
+        self.stages[stage_name].put(item)
+
+    def complete(self, item):
+        with self._idle:
+            self._in_flight -= 1
+            self._idle.notify_all()
+        self._slots.release()
+
+    def _worker(self, stage):
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                return
+            if self._error is not None:
+                self._slots.release()  # let a blocked reader notice the failure
+                continue
+            started = time.perf_counter()
+            try:
+                stage.handler(item)
+            except BaseException as e:  # surfaced from run()
+                with self._idle:
+                    self._error = e
+                    self._idle.notify_all()
+                self._slots.release()
+            with stage._lock:
+                stage.busy_seconds += time.perf_counter() - started
+                stage.processed += 1
+
+    def run(self, source, route):
+        """Feed every item of source into stage route(item); return once all are complete"""
+        started = time.perf_counter()
+        for stage in self.stages.values():
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(stage,), name=f"{stage.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        try:
+            for item in source:
+                self._slots.acquire()
+                if self._error is not None:
+                    break
+                with self._idle:
+                    self._in_flight += 1
+                self.read += 1
+                self.send(route(item), item)
+
+            with self._idle:
+                while self._in_flight > 0 and self._error is None:
+                    self._idle.wait()
+        finally:
+            for stage in self.stages.values():
+                for _ in range(stage.workers):
+                    stage.queue.put(_STOP)
+            if self._error is None:
+                for thread in self._threads:
+                    thread.join()
+            self.elapsed = time.perf_counter() - started
+
+        if self._error is not None:
+            raise self._error
+
+    def print_report(self):
+        print(f"{'stage':<10} {'workers':>7} {'items':>7} {'items/s':>8} {'busy':>6} {'avg q':>6} {'max q':>6}")
+        print(f"{'read':<10} {1:>7} {self.read:>7} {self.read / self.elapsed if self.elapsed else 0:>8.1f} "
+              f"{'-':>6} {'-':>6} {'-':>6}")
+        for stage in self.stages.values():
+            rate = stage.processed / self.elapsed if self.elapsed else 0
+            busy = stage.busy_seconds / (self.elapsed * stage.workers) if self.elapsed else 0
+            print(f"{stage.name:<10} {stage.workers:>7} {stage.processed:>7} {rate:>8.1f} "
+                  f"{busy:>6.0%} {stage.avg_depth:>6.1f} {stage.max_depth:>6}")
@@ -0,0 +1,74 @@
+# Sentinels of the CSV output (and of journals/manifests written before SiteResult)
+NOT_FOUND_URL = "Not Found"
+NOT_AVAILABLE_PRICE = "Product not available on site"
+NO_LISTED_PRICE = "Price not displayed in listing"
+PRICE_SENTINELS = {NOT_AVAILABLE_PRICE, NO_LISTED_PRICE, "Check site for price"}
+
+
+class SiteResult:
+    """
+    One site's outcome for a product
+    url is None when the product was not found; price is None when it was not
+    found or the listing shows no price
+    """
+    __slots__ = ("url", "price")
+
+    def __init__(self, url=None, price=None):
+        self.url = url
+        self.price = price
+
+    @property
+    def found(self):
+        return self.url is not None
+
+    def csv_url(self):
+        return self.url if self.url is not None else NOT_FOUND_URL
+
+    def csv_price(self):
+        if self.price is not None:
+            return self.price
+        return NO_LISTED_PRICE if self.found else NOT_AVAILABLE_PRICE
+
+    def to_json(self):
+        return {"url": self.url, "price": self.price}
+
+    @classmethod
+    def from_json(cls, data):
+        """Also reads the old sentinel form ({"url": "Not Found", "price": "Product not available on site"})"""
+        url = data.get("url")
+        price = data.get("price")
+        return cls(
+            None if url in (None, NOT_FOUND_URL) else url,
+            None if price in PRICE_SENTINELS else price,
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, SiteResult) and (self.url, self.price) == (other.url, other.price)
+
+    def __repr__(self):
+        return f"SiteResult(url={self.url!r}, price={self.price!r})"
+
+
+# Shared "not found" result - treat as read-only
+NOT_FOUND = SiteResult()
+
+
+class Candidate:
+    """A visual match that passed every filter - the lowest rank per site wins"""
+    __slots__ = ("site_key", "rank", "url", "match", "title", "similarity")
+
+    def __init__(self, site_key, rank, url, match, title, similarity):
+        self.site_key = site_key
+        self.rank = rank
+        self.url = url
+        self.match = match
+        self.title = title
+        self.similarity = similarity
+
+
+def site_results_to_json(site_results):
+    return {site_key: result.to_json() for site_key, result in site_results.items()}
+
+
+def site_results_from_json(data):
+    return {site_key: SiteResult.from_json(result) for site_key, result in (data or {}).items()}
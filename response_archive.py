@@ -0,0 +1,117 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+# Archive frame: 4-byte big-endian length + zlib-compressed JSON
+# {"style_id": ..., "pass": "1" | "2", "response": {"visual_matches": [...]}}
+FRAME_HEADER = struct.Struct(">I")
+
+
+def index_path(path):
+    return f"{path}.idx"
+
+
+class ResponseArchive:
+    """
+    Append-only archive of Lens responses keyed by (style_id, pass)
+    Every response is one compressed frame; its offset goes to a JSON-lines
+    index next to the archive (<path>.idx). Recording the same key again
+    appends a new frame - readers use the last one.
+    """
+    def __init__(self, path, compress_level=6):
+        self.path = path
+        self.compress_level = compress_level
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        self._index = open(index_path(path), 'a', encoding='utf-8')
+
+    def append(self, style_id, pass_label, response):
+        raw = json.dumps({"style_id": style_id, "pass": pass_label, "response": response}, ensure_ascii=False)
+        data = zlib.compress(raw.encode("utf-8"), self.compress_level)
+        with self._lock:
+            offset = self._file.tell() + FRAME_HEADER.size
+            self._file.write(FRAME_HEADER.pack(len(data)))
+            self._file.write(data)
+            self._file.flush()
+            entry = {"style_id": style_id, "pass": pass_label, "offset": offset, "length": len(data)}
+            self._index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._index.flush()
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._index.close()
+
+
+class ArchiveReader:
+    """
+    Read-only, memory-mapped view of a ResponseArchive
+    The index is loaded into memory; frames written after the last index line
+    (a run killed between the two writes) are recovered by scanning the tail.
+    Several processes can map the same archive - the pages are shared.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._offsets = {}   # (style_id, pass) -> (offset, length)
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        indexed_end = self._load_index()
+        self._scan(indexed_end, size)
+
+    def _load_index(self):
+        end = 0
+        if not os.path.exists(index_path(self.path)):
+            return end
+        with open(index_path(self.path), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line
+                frame_end = entry['offset'] + entry['length']
+                if frame_end > len(self._map):
+                    continue
+                self._offsets[(entry['style_id'], entry['pass'])] = (entry['offset'], entry['length'])
+                end = max(end, frame_end)
+        return end
+
+    def _scan(self, position, size):
+        while position + FRAME_HEADER.size <= size:
+            (length,) = FRAME_HEADER.unpack_from(self._map, position)
+            offset = position + FRAME_HEADER.size
+            if offset + length > size:
+                break  # torn last frame
+            record = self._decode(offset, length)
+            self._offsets[(record['style_id'], record['pass'])] = (offset, length)
+            position = offset + length
+
+    def _decode(self, offset, length):
+        return json.loads(zlib.decompress(self._map[offset:offset + length]).decode("utf-8"))
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def has(self, style_id, pass_label):
+        return (style_id, pass_label) in self._offsets
+
+    def get(self, style_id, pass_label):
+        """The archived response, or None when (style_id, pass) was never recorded"""
+        location = self._offsets.get((style_id, pass_label))
+        if location is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._decode(*location)['response']
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
@@ -0,0 +1,63 @@
+import json
+import os
+import threading
+
+from records import site_results_to_json
+
+
+class RunJournal:
+    """
+    Append-only checkpoint journal (JSON lines) of finished products
+    One line per completed style_id with its per-site results, fsync'd as
+    each product finishes so a killed run loses at most the products in flight
+    """
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.completed = self.load(path) if resume else {}
+        self._lock = threading.Lock()
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if resume and self._file.tell() > 0 and not _ends_with_newline(path):
+            # Terminate a torn last line so the next record starts cleanly
+            self._file.write("\n")
+
+    @staticmethod
+    def load(path):
+        """Read journaled results keyed by style_id (a torn last line is ignored)"""
+        completed = {}
+        if not os.path.exists(path):
+            return completed
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                completed[entry['style_id']] = entry
+        return completed
+
+    def get(self, style_id):
+        return self.completed.get(style_id)
+
+    def record(self, result_entry):
+        """Append one finished product and force it to disk"""
+        entry = {
+            'style_id': result_entry['product']['style_id'],
+            'status': result_entry['status'],
+            'brand_site': result_entry['brand_site'],
+            'site_results': site_results_to_json(result_entry['site_results']),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from records import site_results_to_json
+
+
+def row_hash(product):
+    """Content hash of one input row (every field that can change the search result)"""
+    raw = json.dumps(product, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class RunManifest:
+    """
+    Last known result of every catalog row across runs (SQLite file)
+    One entry per style_id: the row's content hash, its result and when it was
+    searched. Delta runs carry a row's result forward while its hash matches and
+    the result is younger than max_age_seconds.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            " style_id TEXT PRIMARY KEY,"
+            " row_hash TEXT NOT NULL,"
+            " result TEXT NOT NULL,"
+            " searched_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def lookup(self, product, max_age_seconds=None):
+        """
+        Returns (state, result) - state is "new", "changed", "stale" or "unchanged";
+        result is the stored result for "unchanged" rows, else None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT row_hash, result, searched_at FROM manifest WHERE style_id = ?", (product['style_id'],)
+            ).fetchone()
+        if row is None:
+            return "new", None
+        stored_hash, result, searched_at = row
+        if stored_hash != row_hash(product):
+            return "changed", None
+        if max_age_seconds is not None and time.time() - searched_at > max_age_seconds:
+            return "stale", None
+        return "unchanged", json.loads(result)
+
+    def record(self, result_entry):
+        """Store a freshly searched row's result (keyed by style_id, replacing the old one)"""
+        product = result_entry['product']
+        result = {
+            'status': result_entry['status'],
+            'brand_site': result_entry['brand_site'],
+            'site_results': site_results_to_json(result_entry['site_results']),
+        }
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO manifest (style_id, row_hash, result, searched_at) VALUES (?, ?, ?, ?)",
+                (product['style_id'], row_hash(product), json.dumps(result, ensure_ascii=False), time.time()),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,185 @@
+import json
+import math
+import os
+import threading
+import time
+
+# Latency buckets (seconds) for SerpAPI calls
+LATENCY_BUCKETS = [0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 45, 60, math.inf]
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """Bucket upper bound holding the q-quantile (coarse, but cheap)"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+
+def _finite(value):
+    return None if value == math.inf else value
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Metrics:
+    """
+    Thread-safe run metrics - counters, gauges and histograms with labels
+    Exported as JSON or Prometheus text format (export())
+    """
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_counts(self, name, counts, **labels):
+        """Add several counters at once - counts maps a label dict (as tuple of pairs) to a value"""
+        with self._lock:
+            for extra, value in counts.items():
+                key = (name, _label_key({**labels, **dict(extra)}))
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def gauge(self, name, **labels):
+        with self._lock:
+            return self._gauges.get((name, _label_key(labels)), 0)
+
+    def counter_total(self, name, **labels):
+        """Sum of a counter over every label set that includes labels"""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(v for (n, key), v in self._counters.items() if n == name and wanted <= set(key))
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            return {
+                "elapsed_seconds": round(elapsed, 3),
+                "counters": [
+                    {"name": n, "labels": dict(k), "value": v} for (n, k), v in sorted(self._counters.items())
+                ],
+                "gauges": [
+                    {"name": n, "labels": dict(k), "value": v} for (n, k), v in sorted(self._gauges.items())
+                ],
+                "histograms": [
+                    {
+                        "name": n, "labels": dict(k), "count": h.count, "sum": round(h.sum, 4),
+                        "p50": _finite(h.quantile(0.5)), "p95": _finite(h.quantile(0.95)),
+                        "p99": _finite(h.quantile(0.99)),
+                        "buckets": {str(b): c for b, c in zip(h.buckets, h.counts)},
+                    }
+                    for (n, k), h in sorted(self._histograms.items())
+                ],
+            }
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            for (name, key), value in sorted(self._counters.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+            for (name, key), value in sorted(self._gauges.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+            for (name, key), h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == math.inf else f"{bound:g}"
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {h.sum:.4f}")
+                lines.append(f"{name}_count{_format_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write metrics to path - Prometheus text for .prom/.txt, JSON otherwise (atomic replace)"""
+        if path.endswith((".prom", ".txt")):
+            content = self.to_prometheus()
+        else:
+            snapshot = self.snapshot()
+            content = json.dumps(snapshot, indent=2)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+class PeriodicExporter:
+    """Background thread exporting metrics every interval seconds (and once on stop)"""
+    def __init__(self, metrics, path, interval, before_export=None):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.before_export = before_export
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _export(self):
+        if self.before_export:
+            self.before_export()
+        self.metrics.export(self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._export()
+
+    def start(self):
+        if self.interval and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._export()
@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SingleFlight:
+    """
+    Request coalescing for identical lookups
+    - Concurrent calls with the same key wait for the first one and share its result
+    - Finished results are remembered for the last memo_size keys, so repeats
+      later in the run are answered without a new request
+    - pin(key, uses) keeps a key's result, outside the memo, until it has been
+      requested uses times (lookups known in advance to repeat far apart)
+    Failed calls (None) are shared with waiters but not remembered.
+    """
+    def __init__(self, memo_size=2048):
+        self.memo_size = memo_size
+        self.shared_in_flight = 0
+        self.shared_repeats = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._memo = OrderedDict()
+        self._pins = {}   # key -> [uses left, result]
+
+    def pin(self, key, uses):
+        with self._lock:
+            self._pins[key] = [uses, None]
+
+    def _use_pin(self, key):
+        pin = self._pins.get(key)
+        if pin is not None:
+            pin[0] -= 1
+            if pin[0] <= 0:
+                del self._pins[key]
+
+    def do(self, key, func):
+        with self._lock:
+            pin = self._pins.get(key)
+            if pin is not None and pin[1] is not None:
+                self._use_pin(key)
+                self.shared_repeats += 1
+                return pin[1]
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                self.shared_repeats += 1
+                return self._memo[key]
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+            else:
+                self.shared_in_flight += 1
+                self._use_pin(key)
+
+        if not leader:
+            call.done.wait()
+            return call.result
+
+        try:
+            call.result = func()
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if call.result is not None and key in self._pins:
+                    self._pins[key][1] = call.result
+                    self._use_pin(key)
+                if call.result is not None and self.memo_size:
+                    self._memo[key] = call.result
+                    if len(self._memo) > self.memo_size:
+                        self._memo.popitem(last=False)
+            call.done.set()
+        return call.result
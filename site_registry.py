@@ -0,0 +1,213 @@
+import json
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+
+def normalize_brand(brand_name):
+    """Lowercase and drop spaces, hyphens and underscores ("The Bear-House" → "thebearhouse")"""
+    return brand_name.lower().replace(" ", "").replace("-", "").replace("_", "")
+
+
+def trie_pattern(words):
+    """
+    Regex source matching any of words, factored as a trie ("bear", "bat" → "b(?:at|ear)")
+    A flat "w1|w2|..." alternation is tried one word at a time at every text
+    position; the trie branches on one character per step, so a search costs
+    about the same however many words there are. Only presence is matched:
+    a word extending a shorter one ("bearhouse" after "bear") is dropped.
+    """
+    trie = {}
+    for word in sorted(words, key=len):
+        node = trie
+        for char in word:
+            if node.get("") is not None:
+                break  # a shorter word already matches here
+            node = node.setdefault(char, {})
+        else:
+            node.clear()
+            node[""] = True
+
+    def build(node):
+        if "" in node:
+            return ""
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    return build(trie)
+
+
+class SiteRegistry:
+    """
+    Site/brand knowledge compiled into the lookup tables the hot path needs
+    Built from the registry file (site_registry.json) - see load_registry()
+    - domain_index: registered domain -> site key (hostname suffix lookup)
+    - product_rules: registered domain -> compiled product-path regex (None = accept all)
+    - invalid_url_re: one regex for all non-product URL patterns
+    - brand_sites: normalized brand name -> brand site key
+    - brand matchers: one compiled regex per brand (built on first use)
+    """
+    def __init__(self, data, path=None, mtime=None):
+        self.path = path
+        self.mtime = mtime
+        self.primary_sites = list(data.get("primary_sites", []))
+        self.marketplaces = frozenset(self.primary_sites)
+
+        presets = data.get("path_presets", {})
+        self.shopping_sites = {}
+        self.domain_index = {}
+        self.product_rules = {}
+        for site_key, entry in data.get("sites", {}).items():
+            domains = [d.lower() for d in entry.get("domains", [])]
+            self.shopping_sites[site_key] = domains
+            for domain in domains:
+                # First registration wins (sub-brands sharing sassafras.in → "sassafras")
+                self.domain_index.setdefault(domain, site_key)
+                if "product_path" in entry and domain not in self.product_rules:
+                    pattern = presets.get(entry["product_path"], entry["product_path"])
+                    self.product_rules[domain] = re.compile(pattern) if pattern else None
+
+        self.invalid_url_re = re.compile(
+            "|".join(re.escape(p) for p in data.get("invalid_url_patterns", [])) or r"(?!)"
+        )
+
+        self.brand_sites = {normalize_brand(k): v for k, v in data.get("brand_sites", {}).items()}
+        self.brand_site_fallbacks = [
+            (tuple(entry["keywords"]), entry["site"]) for entry in data.get("brand_site_fallbacks", [])
+        ]
+        self.brand_aliases = [
+            ([tuple(group) for group in entry["triggers"]], list(entry["aliases"]))
+            for entry in data.get("brand_aliases", [])
+        ]
+        self.query_overrides = [
+            (tuple(entry["keywords"]), entry["query"]) for entry in data.get("query_overrides", [])
+        ]
+
+        # Per-registry caches - a reload starts with fresh ones
+        self.identify_host = lru_cache(maxsize=65536)(self._identify_host)
+        self.brand_site = lru_cache(maxsize=4096)(self._brand_site)
+        self.brand_matcher = lru_cache(maxsize=4096)(self._brand_matcher)
+
+    def _suffixes(self, host):
+        labels = host.split(".")
+        for i in range(len(labels) - 1):
+            yield ".".join(labels[i:])
+
+    def _identify_host(self, host):
+        """Site key for a hostname (m.myntra.com → myntra.com → com), or None"""
+        for suffix in self._suffixes(host):
+            site_key = self.domain_index.get(suffix)
+            if site_key:
+                return site_key
+        return None
+
+    def product_rule(self, host):
+        """
+        Product-path rule for a hostname
+        Returns (matched, rule) - matched is False when no domain rule applies
+        """
+        for suffix in self._suffixes(host):
+            if suffix in self.product_rules:
+                return True, self.product_rules[suffix]
+        return False, None
+
+    def is_marketplace(self, site_key):
+        return site_key in self.marketplaces
+
+    def _brand_site(self, brand_name):
+        """Brand's own site key, or None"""
+        brand_lower = normalize_brand(brand_name)
+        site_key = self.brand_sites.get(brand_lower)
+        if site_key and site_key in self.shopping_sites:
+            return site_key
+        for keywords, site_key in self.brand_site_fallbacks:
+            if any(keyword in brand_lower for keyword in keywords) and site_key in self.shopping_sites:
+                return site_key
+        return None
+
+    def brand_variations(self, target_brand):
+        """All spellings accepted as evidence of target_brand (name variants + registry aliases)"""
+        target_lower = target_brand.lower()
+
+        brand_keywords = target_lower.replace("-", " ").replace("_", " ").split()
+
+        variations = [
+            target_lower.replace(" ", ""),
+            target_lower.replace(" ", "-"),
+            target_lower.replace(" ", "_"),
+            target_lower,
+        ]
+
+        if len(brand_keywords) > 1:
+            variations.append("".join(brand_keywords))
+
+            if brand_keywords[0] in ["the"]:
+                without_the = " ".join(brand_keywords[1:])
+                variations.append(without_the)
+                variations.append(without_the.replace(" ", ""))
+
+        for triggers, aliases in self.brand_aliases:
+            if any(all(word in target_lower for word in group) for group in triggers):
+                variations.extend(aliases)
+
+        return variations
+
+    def _brand_matcher(self, target_brand):
+        """One compiled regex finding any variation of the brand (None if no usable variation)"""
+        variations = {v for v in self.brand_variations(target_brand) if v and len(v) > 2}
+        if not variations:
+            return None
+        return re.compile(trie_pattern(variations))
+
+    def query_brand(self, brand_name):
+        """Brand text to send with the Pass 2 query (sub-brands search as their parent)"""
+        brand_lower = brand_name.lower()
+        for keywords, query in self.query_overrides:
+            if any(keyword in brand_lower for keyword in keywords):
+                return query
+        return brand_name
+
+
+def load_registry(path):
+    """Read and compile a registry file"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return SiteRegistry(data, path=path, mtime=os.path.getmtime(path))
+
+
+class RegistryWatcher:
+    """
+    Holds the current registry and hot-reloads it when the file changes
+    The file's mtime is checked at most every check_interval seconds; a broken
+    edit keeps the last good registry in place
+    """
+    def __init__(self, path, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.registry = load_registry(path)
+        self._next_check = time.monotonic() + check_interval
+        self._failed_mtime = None   # a broken version is reported once, not on every check
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return self.registry
+        with self._lock:
+            if now >= self._next_check:
+                self._next_check = now + self.check_interval
+                self._reload_if_changed()
+        return self.registry
+
+    def _reload_if_changed(self):
+        mtime = None
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime in (self.registry.mtime, self._failed_mtime):
+                return
+            self.registry = load_registry(self.path)
+            print(f"  🔁 Site registry reloaded: {self.path}")
+        except Exception as e:  # any malformed edit ("domains": null, "sites": [] ...) - never abort the run
+            self._failed_mtime = mtime
+            print(f"  ⚠ Site registry reload failed, keeping previous version: {type(e).__name__}: {e}")
@@ -0,0 +1,100 @@
+import functools
+import io
+import os
+import sys
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+from image_dedupe import ImageFetcher, dhash, group_near_duplicates, hamming
+
+HASH_DISTANCE = 4   # local.py IMAGE_HASH_DISTANCE (--hash-distance default)
+
+
+def product_photo(size, stripes):
+    """A catalog-like image: gradient background with a few shapes"""
+    image = Image.new("RGB", (400, 400))
+    draw = ImageDraw.Draw(image)
+    for y in range(400):
+        draw.line([(0, y), (399, y)], fill=(y * 255 // 400, 120, 255 - y * 255 // 400))
+    for i in range(stripes):
+        draw.rectangle([40 + i * 60, 80, 70 + i * 60, 320], fill=(240, 240, 20))
+    draw.ellipse([150, 150, 260, 260], fill=(10, 10, 10))
+    return image.resize(size)
+
+
+def save(image, path, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    path.write_bytes(buffer.getvalue())
+    return path
+
+
+@pytest.fixture
+def images(tmp_path):
+    original = product_photo((400, 400), stripes=3)
+    return {
+        "original": save(original, tmp_path / "original.jpg", quality=95),
+        "resized": save(original.resize((220, 220)), tmp_path / "resized.jpg", quality=70),
+        "different": save(product_photo((400, 400), stripes=0).rotate(90), tmp_path / "different.jpg", quality=95),
+    }
+
+
+@pytest.fixture
+def http_root(images):
+    handler = functools.partial(QuietHandler, directory=str(images["original"].parent))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def test_hash_all_reads_file_urls_paths_and_http(images, http_root):
+    fetcher = ImageFetcher(workers=4, timeout=5)
+    urls = {
+        "path": str(images["original"]),
+        "file": images["original"].as_uri(),
+        "http": f"{http_root}/original.jpg",
+    }
+    hashes = fetcher.hash_all(list(urls.values()))
+    expected = dhash(images["original"].read_bytes())
+    assert {kind: hashes[url] for kind, url in urls.items()} == {"path": expected, "file": expected, "http": expected}
+
+
+def test_unreachable_images_hash_to_none(tmp_path, http_root):
+    fetcher = ImageFetcher(workers=2, timeout=5)
+    (tmp_path / "not_an_image.jpg").write_bytes(b"<html>404</html>")
+    urls = [str(tmp_path / "missing.jpg"), f"{http_root}/missing.jpg", str(tmp_path / "not_an_image.jpg")]
+    assert fetcher.hash_all(urls) == dict.fromkeys(urls)
+
+
+def test_resized_copy_groups_with_original_over_http(images, http_root):
+    fetcher = ImageFetcher(workers=4, timeout=5)
+    urls = [f"{http_root}/original.jpg", images["resized"].as_uri(), f"{http_root}/different.jpg"]
+    hashes = fetcher.hash_all(urls)
+    assert hamming(hashes[urls[0]], hashes[urls[1]]) <= HASH_DISTANCE
+    assert hamming(hashes[urls[0]], hashes[urls[2]]) > HASH_DISTANCE
+
+    groups = group_near_duplicates([(url, hashes[url]) for url in urls], HASH_DISTANCE)
+    assert groups == {urls[0]: urls[0], urls[1]: urls[0], urls[2]: urls[2]}
+
+
+def test_group_near_duplicates_respects_the_distance():
+    hashes = [("a", 0b0000), ("b", 0b0111), ("c", 0b1111_0000_0000), ("d", 0b0001)]
+    assert group_near_duplicates(hashes, 0) == {"a": "a", "b": "b", "c": "c", "d": "d"}
+    assert group_near_duplicates(hashes, 1) == {"a": "a", "b": "b", "c": "c", "d": "a"}
+    # "b" is 3 bits from "a": grouped at distance 3, and "d" goes to its nearest representative
+    assert group_near_duplicates(hashes, 3) == {"a": "a", "b": "a", "c": "c", "d": "a"}
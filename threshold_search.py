@@ -0,0 +1,397 @@
+"""
+Threshold grid search: score thousands of match filter settings against a labeled catalog
+
+A recorded run (local.py --record) is turned once into candidate arrays, with
+one row per visual match of a searched site. Each row holds the match's rank,
+price deviation, keyword overlap, colour match and site. Matches that the
+threshold-free filters (brand, URL, category) reject are dropped. Each threshold
+combination is then a few NumPy array operations instead of a Python loop over
+matches. The picks are the ones local.extract_product_info makes with the same
+settings, including the Pass 1 → Pass 2 fallback of a replay. --verify checks
+this against the scalar path.
+
+Labels: a CSV with style_id and any of myntra_url, slikk_url, brand_url. Each
+holds the correct product URL, or "Not Found" / empty when the product is not
+on that site, so a corrected output CSV works. Products and columns without a
+label are not scored.
+- precision: found URLs that are the labeled URL / found URLs
+- coverage: products whose labeled URL was found / products labeled with a URL
+- false positives: products labeled "not on the site" that got a URL anyway
+
+Usage: python threshold_search.py catalog.csv run.arc labels.csv
+           [--rank 10,15,20,30] [--price-tolerance 0.2,0.3,0.4,0.5]
+           [--marketplace-similarity 0,3,10,20] [--brand-similarity 0,10,20,30]
+           [--color-bonus 0,15,25] [--color-penalty 0,20,40]
+           [--min-precision 0.9] [--top 10] [--output grid.csv] [--verify 3]
+"""
+import argparse
+import csv
+import itertools
+import os
+import random
+import sys
+import time
+from contextlib import redirect_stdout
+
+try:
+    import numpy as np
+except ImportError:  # optional - only needed for the threshold grid search
+    np = None
+
+import local
+from records import NOT_FOUND_URL
+from response_archive import ArchiveReader
+
+# Threshold name -> local.py setting
+THRESHOLDS = {
+    "rank_cutoff": "RANK_CUTOFF",
+    "price_tolerance": "PRICE_TOLERANCE",
+    "marketplace_similarity": "MARKETPLACE_SIMILARITY",
+    "brand_site_similarity": "BRAND_SITE_SIMILARITY",
+    "color_bonus": "COLOR_BONUS",
+    "color_penalty": "COLOR_PENALTY",
+}
+# Output columns scored against the labels ("brand" = the product's own brand site)
+COLUMNS = ("myntra", "slikk", "brand")
+LABELED_ABSENT = -1   # label_id: the product is not on the site
+UNLABELED = -2        # label_id: no label for this column
+
+
+def current_thresholds():
+    return {name: getattr(local, setting) for name, setting in THRESHOLDS.items()}
+
+
+def load_labels(path):
+    """{style_id: {column: canonical URL, or None when not on the site}} - labeled columns only"""
+    labels = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            entry = {}
+            for column in COLUMNS:
+                value = row.get(f"{column}_url")
+                if value is None:
+                    continue
+                value = value.strip()
+                entry[column] = local.canonicalize_url(value) if value and value != NOT_FOUND_URL else None
+            labels[row['style_id']] = entry
+    return labels
+
+
+def site_columns(product):
+    """(sites searched for the product, {site_key: COLUMNS index})"""
+    registry = local.get_registry()
+    brand_site = registry.brand_site(product['brand'])
+    allowed_sites = registry.primary_sites + ([brand_site] if brand_site else [])
+    columns = {}
+    for site_key in allowed_sites:
+        if site_key == brand_site:
+            columns[site_key] = COLUMNS.index("brand")
+        elif site_key in COLUMNS:
+            columns[site_key] = COLUMNS.index(site_key)
+    return allowed_sites, columns
+
+
+class CandidateArrays:
+    """
+    The candidates of a labeled, recorded catalog as NumPy arrays
+    Rows are sorted by (product, column, pass, rank). The first row of a
+    (product, column) key that passes the thresholds is the scalar path's pick:
+    the lowest-rank Pass 1 match, else the lowest-rank Pass 2 match.
+    key = product index * 3 + column
+    """
+    def __init__(self, products, archive, labels, max_rank):
+        if np is None:
+            raise RuntimeError("threshold search needs numpy (pip install numpy)")
+        self.products = []
+        self.responses = []   # (Pass 1, Pass 2 or None) per product
+        url_ids = {}
+        label_ids = []
+        rows = []
+        registry = local.get_registry()
+
+        for product in products:
+            label = labels.get(product['style_id'])
+            pass1 = archive.get(product['style_id'], "1")
+            if label is None or pass1 is None:
+                continue  # not labeled, or not searched in the recorded run
+            pass2 = archive.get(product['style_id'], "2")
+            product_index = len(self.products)
+            self.products.append(product)
+            self.responses.append((pass1, pass2))
+
+            for column in COLUMNS:
+                if column not in label:
+                    label_ids.append(UNLABELED)
+                elif label[column] is None:
+                    label_ids.append(LABELED_ABSENT)
+                else:
+                    label_ids.append(url_ids.setdefault(label[column], len(url_ids)))
+
+            _, columns = site_columns(product)
+            context = local.filter_context(product['brand'], product)
+            features = local.title_features(product.get('product_title', ''))
+            for pass_index, response in enumerate((pass1, pass2)):
+                if response is None:
+                    continue
+                for rank, match in enumerate(response.get("visual_matches", [])[:max_rank], 1):
+                    link = match.get("link", "")
+                    if not link:
+                        continue
+                    site_key = local.identify_site(link)
+                    column = columns.get(site_key)
+                    if column is None:
+                        continue
+                    # Every copy of a URL is a row: the first one that passes wins, as in
+                    # extract_product_info (copies differ in title and price)
+                    title = match.get("title", "").lower()
+                    if not (local.brand_filter(match, site_key, link, title, context)
+                            and local.url_filter(match, site_key, link, title, context)
+                            and local.category_filter(match, site_key, link, title, context)):
+                        continue  # rejected whatever the thresholds
+                    deviation = local.price_deviation(match, context['price'])
+                    parts = features(title)
+                    rows.append((
+                        product_index * 3 + column, pass_index, rank, registry.is_marketplace(site_key),
+                        np.nan if deviation is None else deviation,
+                        parts is not None, parts[0] if parts else 0.0, parts[1] if parts else 0,
+                        url_ids.setdefault(local.canonicalize_url(link), len(url_ids)),
+                    ))
+
+        rows.sort(key=lambda row: (row[0], row[1], row[2]))
+        columns = list(zip(*rows)) or [()] * 9
+        self.key = np.array(columns[0], dtype=np.int64)
+        self.rank = np.array(columns[2], dtype=np.int32)
+        self.marketplace = np.array(columns[3], dtype=bool)
+        self.deviation = np.array(columns[4], dtype=np.float64)
+        self.scoreable = np.array(columns[5], dtype=bool)
+        self.overlap = np.array(columns[6], dtype=np.float64)
+        self.color = np.array(columns[7], dtype=np.int8)
+        self.url_id = np.array(columns[8], dtype=np.int64)
+        self.label_id = np.array(label_ids, dtype=np.int64)
+        self.urls = [None] * len(url_ids)
+        for url, url_id in url_ids.items():
+            self.urls[url_id] = url
+        # per column: products labeled with a URL / labeled as not on the site
+        self.labeled = np.bincount(np.flatnonzero(self.label_id >= 0) % 3, minlength=3)
+        self.labeled_absent = np.bincount(np.flatnonzero(self.label_id == LABELED_ABSENT) % 3, minlength=3)
+
+    def __len__(self):
+        return len(self.key)
+
+    def similarity(self, color_bonus, color_penalty):
+        """Title similarity (0-100) of every row - local.title_scorer as array operations"""
+        bonus = np.where(self.color > 0, color_bonus, np.where(self.color < 0, -color_penalty, 0))
+        return np.where(self.scoreable, np.clip(self.overlap + bonus, 0, 100), 0)
+
+    def rank_and_price_ok(self, rank_cutoff, price_tolerance):
+        # NaN deviation (no price to compare) passes, as in local.price_filter
+        return (self.rank <= rank_cutoff) & ~(self.deviation > price_tolerance)
+
+    def similarity_ok(self, similarity, marketplace_similarity, brand_site_similarity):
+        return similarity >= np.where(self.marketplace, marketplace_similarity, brand_site_similarity)
+
+    def first_valid(self, valid):
+        """(keys, url_ids) of the pick of every (product, column) with a valid row"""
+        rows = np.flatnonzero(valid)
+        keys = self.key[rows]
+        first = np.flatnonzero(np.diff(keys, prepend=-1))
+        return keys[first], self.url_id[rows[first]]
+
+    def picks(self, thresholds):
+        similarity = self.similarity(thresholds['color_bonus'], thresholds['color_penalty'])
+        valid = self.rank_and_price_ok(thresholds['rank_cutoff'], thresholds['price_tolerance']) & \
+            self.similarity_ok(similarity, thresholds['marketplace_similarity'], thresholds['brand_site_similarity'])
+        return self.first_valid(valid)
+
+    def score(self, keys, url_ids):
+        """
+        (found, correct, false_found) per column over the labeled (product, column) pairs
+        false_found: URLs found for products labeled as not on the site
+        """
+        labels = self.label_id[keys]
+        scored = labels != UNLABELED
+        columns = keys[scored] % 3
+        found = np.bincount(columns, minlength=3)
+        correct = np.bincount(columns[url_ids[scored] == labels[scored]], minlength=3)
+        false_found = np.bincount(columns[labels[scored] == LABELED_ABSENT], minlength=3)
+        return found, correct, false_found
+
+
+def grid_search(arrays, grid):
+    """Yield (thresholds, found, correct, false_found) for every combination of grid {threshold: [values]}"""
+    for color_bonus, color_penalty in itertools.product(grid['color_bonus'], grid['color_penalty']):
+        similarity = arrays.similarity(color_bonus, color_penalty)
+        for rank_cutoff, price_tolerance in itertools.product(grid['rank_cutoff'], grid['price_tolerance']):
+            base = arrays.rank_and_price_ok(rank_cutoff, price_tolerance)
+            for marketplace_similarity, brand_site_similarity in itertools.product(
+                    grid['marketplace_similarity'], grid['brand_site_similarity']):
+                valid = base & arrays.similarity_ok(similarity, marketplace_similarity, brand_site_similarity)
+                found, correct, false_found = arrays.score(*arrays.first_valid(valid))
+                thresholds = {
+                    'rank_cutoff': rank_cutoff, 'price_tolerance': price_tolerance,
+                    'marketplace_similarity': marketplace_similarity, 'brand_site_similarity': brand_site_similarity,
+                    'color_bonus': color_bonus, 'color_penalty': color_penalty,
+                }
+                yield thresholds, found, correct, false_found
+
+
+def scalar_picks(arrays, thresholds):
+    """{key: url} from local.extract_product_info with these thresholds (Pass 1, then Pass 2 for missing sites)"""
+    saved = current_thresholds()
+    for name, value in thresholds.items():
+        setattr(local, THRESHOLDS[name], value)
+    picks = {}
+    try:
+        with open(os.devnull, "w", encoding="utf-8") as devnull, redirect_stdout(devnull):
+            for product_index, (product, (pass1, pass2)) in enumerate(zip(arrays.products, arrays.responses)):
+                allowed_sites, columns = site_columns(product)
+                results, _, _ = local.extract_product_info(
+                    pass1.get("visual_matches", []), product['brand'], allowed_sites, product)
+                missing = [site_key for site_key in allowed_sites if not results[site_key].found]
+                if missing and pass2 is not None:
+                    results_pass2, _, _ = local.extract_product_info(
+                        pass2.get("visual_matches", []), product['brand'], missing, product, pass_type="second")
+                    for site_key in missing:
+                        results[site_key] = results_pass2[site_key]
+                for site_key, result in results.items():
+                    if result.found and site_key in columns:
+                        picks[product_index * 3 + columns[site_key]] = result.url
+    finally:
+        for name, value in saved.items():
+            setattr(local, THRESHOLDS[name], value)
+    return picks
+
+
+def verify(arrays, threshold_sets):
+    """Mismatches between the vectorized and the scalar picks: [(thresholds, style_id, column, vectorized, scalar)]"""
+    mismatches = []
+    for thresholds in threshold_sets:
+        keys, url_ids = arrays.picks(thresholds)
+        vectorized = {int(key): arrays.urls[url_id] for key, url_id in zip(keys, url_ids)}
+        scalar = scalar_picks(arrays, thresholds)
+        for key in sorted(set(vectorized) | set(scalar)):
+            if vectorized.get(key) != scalar.get(key):
+                mismatches.append((thresholds, arrays.products[key // 3]['style_id'], COLUMNS[key % 3],
+                                   vectorized.get(key), scalar.get(key)))
+    return mismatches
+
+
+def summarize(thresholds, found, correct, false_found, arrays):
+    row = dict(thresholds)
+    for i, column in enumerate(COLUMNS):
+        row[f"{column}_found"] = int(found[i])
+        row[f"{column}_correct"] = int(correct[i])
+        row[f"{column}_false_positives"] = int(false_found[i])
+        row[f"{column}_precision"] = correct[i] / found[i] if found[i] else None
+        row[f"{column}_coverage"] = correct[i] / arrays.labeled[i] if arrays.labeled[i] else None
+        row[f"{column}_false_positive_rate"] = (
+            false_found[i] / arrays.labeled_absent[i] if arrays.labeled_absent[i] else None)
+    row['correct'] = int(correct.sum())
+    row['precision'] = correct.sum() / found.sum() if found.sum() else None
+    return row
+
+
+def percent(value):
+    return f"{value:>4.0%}" if value is not None else "   -"
+
+
+def print_rows(rows):
+    print(f"{'rank':>4} {'price':>5} {'mkt':>4} {'brand':>5} {'+col':>4} {'-col':>4} |"
+          + "".join(f" {column:>6} P / C / FP |" for column in COLUMNS) + f" {'correct':>7} {'precision':>9}")
+    for row in rows:
+        print(f"{row['rank_cutoff']:>4g} {row['price_tolerance']:>5.0%} {row['marketplace_similarity']:>4g} "
+              f"{row['brand_site_similarity']:>5g} {row['color_bonus']:>4g} {row['color_penalty']:>4g} |"
+              + "".join(f" {percent(row[f'{column}_precision'])} / {percent(row[f'{column}_coverage'])}"
+                        f" / {percent(row[f'{column}_false_positive_rate'])} |" for column in COLUMNS)
+              + f" {row['correct']:>7} {percent(row['precision']):>9}")
+
+
+def parse_values(text, value_type=float):
+    return [value_type(value) for value in text.split(",") if value.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("catalog", help="input catalog CSV of the recorded run")
+    parser.add_argument("archive", help="response archive (local.py --record)")
+    parser.add_argument("labels", help="labeled CSV: style_id, myntra_url, slikk_url, brand_url")
+    parser.add_argument("--rank", default="10,15,20,30", help="RANK_CUTOFF values")
+    parser.add_argument("--price-tolerance", default="0.2,0.3,0.4,0.5", help="PRICE_TOLERANCE values")
+    parser.add_argument("--marketplace-similarity", default="0,3,10,20", help="MARKETPLACE_SIMILARITY values")
+    parser.add_argument("--brand-similarity", default="0,10,20,30", help="BRAND_SITE_SIMILARITY values")
+    parser.add_argument("--color-bonus", default="0,15,25", help="COLOR_BONUS values")
+    parser.add_argument("--color-penalty", default="0,20,40", help="COLOR_PENALTY values")
+    parser.add_argument("--min-precision", type=float, default=0.9, help="overall precision a setting must reach")
+    parser.add_argument("--top", type=int, default=10, help="settings to print")
+    parser.add_argument("--output", default=None, help="write every combination's scores to this CSV")
+    parser.add_argument("--verify", type=int, default=3,
+                        help="threshold sets (current + random grid points) checked against the scalar path")
+    args = parser.parse_args()
+
+    grid = {
+        'rank_cutoff': parse_values(args.rank, int),
+        'price_tolerance': parse_values(args.price_tolerance),
+        'marketplace_similarity': parse_values(args.marketplace_similarity),
+        'brand_site_similarity': parse_values(args.brand_similarity),
+        'color_bonus': parse_values(args.color_bonus),
+        'color_penalty': parse_values(args.color_penalty),
+    }
+    current = current_thresholds()
+    combinations = 1
+    for values in grid.values():
+        combinations *= len(values)
+
+    started = time.monotonic()
+    archive = ArchiveReader(args.archive)
+    arrays = CandidateArrays(local.read_products(args.catalog), archive, load_labels(args.labels),
+                             max_rank=max(grid['rank_cutoff'] + [current['rank_cutoff']]))
+    archive.close()
+    print(f"🔬 Candidates: {len(arrays.products)} labeled product(s), {len(arrays)} row(s) "
+          f"in {time.monotonic() - started:.1f}s | labeled: "
+          + ", ".join(f"{column} {int(n)} (+{int(absent)} not on site)"
+                      for column, n, absent in zip(COLUMNS, arrays.labeled, arrays.labeled_absent)))
+
+    if args.verify:
+        rng = random.Random(0)
+        threshold_sets = [current] + [{name: rng.choice(values) for name, values in grid.items()}
+                                      for _ in range(args.verify - 1)]
+        started = time.monotonic()
+        mismatches = verify(arrays, threshold_sets)
+        if mismatches:
+            print(f"❌ VECTORIZED ≠ SCALAR: {len(mismatches)} pick(s) differ")
+            for thresholds, style_id, column, vectorized, scalar in mismatches[:5]:
+                print(f"   {style_id} {column}: {vectorized} vs {scalar} ({thresholds})")
+            sys.exit(1)
+        print(f"✅ Vectorized == scalar picks for {len(threshold_sets)} threshold set(s) "
+              f"({time.monotonic() - started:.1f}s scalar)")
+
+    started = time.monotonic()
+    rows = [summarize(thresholds, found, correct, false_found, arrays)
+            for thresholds, found, correct, false_found in grid_search(arrays, grid)]
+    elapsed = time.monotonic() - started
+    print(f"⚙️ Grid: {combinations} combination(s) in {elapsed:.1f}s "
+          f"({elapsed / combinations * 1000 if combinations else 0:.1f}ms each)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else list(THRESHOLDS))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"💾 Scores: {args.output}")
+
+    print(f"\nCURRENT (local.py):")
+    print_rows([summarize(current, *arrays.score(*arrays.picks(current)), arrays)])
+
+    qualified = [row for row in rows if (row['precision'] or 0) >= args.min_precision]
+    if qualified:
+        print(f"\nTOP {args.top} (overall precision ≥ {args.min_precision:.0%}, by correct matches):")
+        qualified.sort(key=lambda row: (-row['correct'], -(row['precision'] or 0)))
+        print_rows(qualified[:args.top])
+    else:
+        print(f"\n⚠️ No setting reaches {args.min_precision:.0%} precision - most precise settings:")
+        rows.sort(key=lambda row: (-(row['precision'] or 0), -row['correct']))
+        print_rows(rows[:args.top])
+
+
+if __name__ == "__main__":
+    main()
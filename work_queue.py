@@ -0,0 +1,228 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class WorkQueue:
+    """
+    Shared job table (SQLite file) for catalog runs split over several processes
+    - enqueue(): products keyed by style_id, kept in input order; later rows
+      repeating a style_id are kept as duplicates that share its result
+    - lease(): a worker takes the next queued products for lease_seconds;
+      leases that expire (worker died or hung) go back to the queue, until a
+      product has been leased max_attempts times - then it is 'failed'
+    - renew(): live workers extend their leases (heartbeat)
+    - complete(): store a result; retryable failures are re-queued up to max_attempts
+    WAL mode + short write transactions, so many worker processes (or machines
+    on a filesystem with working SQLite locking) can share the file.
+    """
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " style_id TEXT PRIMARY KEY,"
+            " position INTEGER NOT NULL,"
+            " product TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'queued',"
+            " owner TEXT,"
+            " lease_expires REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " result TEXT,"
+            " updated_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS duplicates ("
+            " position INTEGER PRIMARY KEY,"
+            " style_id TEXT NOT NULL,"
+            " product TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queued ON jobs(status, position)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_leases ON jobs(status, lease_expires)")
+
+    def _transaction(self, work):
+        """Run work(conn) in one IMMEDIATE (write-locked) transaction"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return result
+
+    def enqueue(self, products):
+        """
+        Add products (dicts with style_id); style_ids queued by an earlier enqueue are left alone
+        A row repeating a style_id added by this call is stored as a duplicate: it
+        is not searched again, but results() returns it with the first row's result.
+        Returns (added, duplicates, skipped)
+        """
+        def work(conn):
+            position = conn.execute(
+                "SELECT MAX(COALESCE((SELECT MAX(position) FROM jobs), 0),"
+                " COALESCE((SELECT MAX(position) FROM duplicates), 0))"
+            ).fetchone()[0]
+            added = duplicates = skipped = 0
+            added_ids = set()
+            now = time.time()
+            for product in products:
+                position += 1
+                product_json = json.dumps(product, ensure_ascii=False)
+                if product['style_id'] in added_ids:
+                    conn.execute("INSERT INTO duplicates (position, style_id, product) VALUES (?, ?, ?)",
+                                 (position, product['style_id'], product_json))
+                    duplicates += 1
+                    continue
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (style_id, position, product, updated_at) VALUES (?, ?, ?, ?)",
+                    (product['style_id'], position, product_json, now),
+                )
+                if cursor.rowcount:
+                    added += 1
+                    added_ids.add(product['style_id'])
+                else:
+                    skipped += 1
+            return added, duplicates, skipped
+        return self._transaction(work)
+
+    def lease(self, owner, limit=1):
+        """
+        Lease up to limit products to owner, queued ones first, then expired leases
+        An expired lease that was already leased max_attempts times is marked
+        'failed' instead (its product crashed or hung every worker that took it).
+        Returns [(style_id, position, product)]
+        """
+        def work(conn):
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', owner = NULL, lease_expires = NULL, updated_at = ?"
+                " WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            rows = conn.execute(
+                "SELECT style_id, position, product FROM jobs WHERE status = 'queued' ORDER BY position LIMIT ?",
+                (limit,),
+            ).fetchall()
+            if len(rows) < limit:
+                rows += conn.execute(
+                    "SELECT style_id, position, product FROM jobs WHERE status = 'leased' AND lease_expires < ?"
+                    " ORDER BY lease_expires LIMIT ?",
+                    (now, limit - len(rows)),
+                ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1,"
+                " updated_at = ? WHERE style_id = ?",
+                [(owner, now + self.lease_seconds, now, style_id) for style_id, _, _ in rows],
+            )
+            return [(style_id, position, json.loads(product)) for style_id, position, product in rows]
+        return self._transaction(work)
+
+    def renew(self, owner):
+        """Extend every lease held by owner"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE owner = ? AND status = 'leased'",
+                (now + self.lease_seconds, owner),
+            )
+
+    def complete(self, style_id, result, retry=False):
+        """
+        Store a product's result (JSON-serializable dict) - the first finisher wins
+        retry=True re-queues it instead while attempts remain (the result is kept
+        so the merge still has something if every attempt fails)
+        Returns the new status, or None when the product was already done
+        """
+        def work(conn):
+            row = conn.execute("SELECT status, attempts FROM jobs WHERE style_id = ?", (style_id,)).fetchone()
+            if row is None or row[0] == 'done':
+                return None
+            status = 'queued' if retry and row[1] < self.max_attempts else 'done'
+            conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_expires = NULL, result = ?, updated_at = ?"
+                " WHERE style_id = ?",
+                (status, json.dumps(result, ensure_ascii=False), time.time(), style_id),
+            )
+            return status
+        return self._transaction(work)
+
+    def release(self, owner):
+        """Hand owner's unfinished leases back to the queue (clean worker shutdown)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, lease_expires = NULL,"
+                " attempts = MAX(attempts - 1, 0) WHERE owner = ? AND status = 'leased'",
+                (owner,),
+            )
+
+    def counts(self):
+        """{status: number of products}"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def duplicate_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM duplicates").fetchone()[0]
+
+    def results(self):
+        """Yield (product, result or None, status) for every input row (duplicates included) in input order"""
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            for _, product, result, status in conn.execute(
+                "SELECT position, product, result, status FROM jobs"
+                " UNION ALL"
+                " SELECT d.position, d.product, j.result, j.status FROM duplicates d JOIN jobs j USING (style_id)"
+                " ORDER BY position"
+            ):
+                yield json.loads(product), json.loads(result) if result else None, status
+        finally:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SharedRateLimiter:
+    """
+    RateLimiter with its slot counter in the queue file, so every worker process
+    together stays within one request rate (slots use wall-clock time - keep
+    machine clocks in sync)
+    """
+    def __init__(self, path, rate_per_second, name="serpapi"):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0
+        self.name = name
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rate_limit (name TEXT PRIMARY KEY, next_slot REAL NOT NULL)")
+
+    def acquire(self):
+        """Block until the caller may send its next request"""
+        if not self.interval:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute("SELECT next_slot FROM rate_limit WHERE name = ?", (self.name,)).fetchone()
+                slot = max(now, row[0] if row else 0.0)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit (name, next_slot) VALUES (?, ?)",
+                    (self.name, slot + self.interval),
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)